@@ -0,0 +1,466 @@
+# Local stand-ins for arXiv, its PDFs and the LLM API, so benchmarks run
+# offline and repeatably. Run the research server against the fake arXiv with:
+#     python bench_stubs.py research [stdio|streamable-http]
+# serve the fake papers' PDFs with:
+#     python bench_stubs.py pdfs [port]
+# and run a stand-in for the fetch MCP server (mcp-server-fetch) with:
+#     python bench_stubs.py fetch
+import datetime
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+# Words the fake corpus is built from, so titles and summaries share terms
+VOCABULARY = [
+    "neural", "network", "learning", "graph", "quantum", "transformer", "attention",
+    "reinforcement", "policy", "gradient", "optimization", "bayesian", "inference",
+    "diffusion", "model", "language", "vision", "robotics", "control", "sparse",
+    "retrieval", "generation", "adversarial", "federated", "privacy", "causal",
+    "kernel", "embedding", "contrastive", "benchmark", "scaling", "compression",
+]
+
+
+class _Author:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class FakePaper:
+    """The subset of arxiv.Result that research_server reads."""
+
+    def __init__(self, index: int) -> None:
+        rng = random.Random(index)
+        self._short_id = f"bench.{index:05d}v1"
+        self.title = " ".join(rng.choice(VOCABULARY) for _ in range(6)).capitalize()
+        self.authors = [_Author(f"Author {rng.randrange(500)}") for _ in range(rng.randint(1, 4))]
+        self.summary = " ".join(rng.choice(VOCABULARY) for _ in range(120))
+        # BENCH_PDF_URL points the papers at a StubPDFServer
+        self.pdf_url = f"{os.environ.get('BENCH_PDF_URL', 'http://arxiv.invalid/pdf')}/{self._short_id}"
+        self.published = datetime.datetime(2015, 1, 1) + datetime.timedelta(days=rng.randrange(3650))
+
+    def get_short_id(self) -> str:
+        return self._short_id
+
+
+class FakeArxivClient:
+    """
+    Drop-in for arxiv.Client: every search sleeps for `latency` seconds and
+    returns papers from a corpus of `corpus_size`, picked by hashing the query.
+    """
+
+    def __init__(self, *args, latency: Optional[float] = None, corpus_size: Optional[int] = None, **kwargs) -> None:
+        self.latency = float(os.environ.get("BENCH_ARXIV_LATENCY", 0.5)) if latency is None else latency
+        self.corpus_size = int(os.environ.get("BENCH_CORPUS_SIZE", 1000)) if corpus_size is None else corpus_size
+
+    def results(self, search):
+        time.sleep(self.latency)
+        seed = int(hashlib.sha1(search.query.encode()).hexdigest(), 16)
+        rng = random.Random(seed)
+        count = min(search.max_results or 10, self.corpus_size)
+        for index in rng.sample(range(self.corpus_size), count):
+            yield FakePaper(index)
+
+
+# Section headings of the fake papers' full text
+SECTIONS = ["Abstract", "1 Introduction", "2 Related Work", "3 Method", "4 Experiments",
+            "5 Conclusion", "References"]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def sample_pdf(index: int, pages: Optional[int] = None) -> bytes:
+    """
+    A small but valid PDF for FakePaper(index): its title, then the SECTIONS
+    filled with vocabulary text, about 50 lines per page.
+    """
+    paper = FakePaper(index)
+    rng = random.Random(index)
+    pages = pages or rng.randint(4, 12)
+    lines = [paper.title, ""]
+    per_section = max(1, pages * 50 // len(SECTIONS) - 2)
+    for section in SECTIONS:
+        lines.append(section)
+        lines += [" ".join(rng.choice(VOCABULARY) for _ in range(12)) for _ in range(per_section)]
+        lines.append("")
+
+    page_lines = [lines[start:start + 50] for start in range(0, len(lines), 50)]
+    count = len(page_lines)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(count))}] /Count {count} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, page in enumerate(page_lines):
+        stream = ("BT /F1 10 Tf 14 TL 72 760 Td " +
+                  " ".join(f"({_pdf_escape(line)}) Tj T*" for line in page) + " ET").encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(pdf)
+
+
+class StubPDFServer:
+    """
+    Serves sample_pdf() for the fake papers at /pdf/<paper id>, like arXiv.
+
+    Supports Range and If-Range requests so resumed downloads can be
+    tested. With drop_after set, the first response for each paper is cut
+    off after that many bytes, as a flaky connection would. With
+    bad_response set, the first response for each paper is instead an HTML
+    error page ("html"), the same page sent as a PDF ("mislabelled"), or a
+    PDF that can't be parsed ("corrupt").
+    """
+
+    def __init__(self, port: int = 0, chunk_delay: float = 0.0, drop_after: Optional[int] = None,
+                 bad_response: Optional[str] = None) -> None:
+        """
+        Args:
+            port: Port to listen on (0 picks a free one)
+            chunk_delay: Seconds to pause between 16 KB chunks, standing in for bandwidth
+            drop_after: Bytes after which each paper's first response is cut off
+            bad_response: "html", "mislabelled" or "corrupt", what each paper's first response is
+        """
+        self.chunk_delay = chunk_delay
+        self.drop_after = drop_after
+        self.bad_response = bad_response
+        self.requests: List[Dict] = []
+        self._dropped = set()
+        self._spoiled = set()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/pdf"
+
+    def start(self) -> "StubPDFServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                match = re.fullmatch(r"/pdf/bench\.(\d+)v1", self.path)
+                if match is None:
+                    self.send_error(404)
+                    return
+                pdf = sample_pdf(int(match.group(1)))
+                etag = f'"{hashlib.sha1(pdf).hexdigest()}"'
+                start = 0
+                range_header = self.headers.get("Range")
+                if range_header and self.headers.get("If-Range", etag) == etag:
+                    start = int(re.match(r"bytes=(\d+)-", range_header).group(1))
+                    if start >= len(pdf):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(pdf)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                stub.requests.append({"path": self.path, "start": start})
+
+                content_type = "application/pdf"
+                if stub.bad_response is not None and self.path not in stub._spoiled:
+                    stub._spoiled.add(self.path)
+                    start = 0
+                    if stub.bad_response in ("html", "mislabelled"):
+                        if stub.bad_response == "html":
+                            content_type = "text/html; charset=utf-8"
+                        pdf = b"<html><body>Service temporarily unavailable</body></html>"
+                    else:
+                        pdf = b"%PDF-1.4\n" + pdf[len(pdf) // 2:]
+                    etag = f'"{hashlib.sha1(pdf).hexdigest()}"'
+
+                self.send_response(206 if start else 200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("ETag", etag)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(len(pdf) - start))
+                if start:
+                    self.send_header("Content-Range", f"bytes {start}-{len(pdf) - 1}/{len(pdf)}")
+                self.end_headers()
+
+                body = pdf[start:]
+                if stub.drop_after is not None and self.path not in stub._dropped:
+                    stub._dropped.add(self.path)
+                    body = body[:stub.drop_after]
+                    self.close_connection = True
+                for offset in range(0, len(body), 16 * 1024):
+                    self.wfile.write(body[offset:offset + 16 * 1024])
+                    if stub.chunk_delay:
+                        time.sleep(stub.chunk_delay)
+
+        return Handler
+
+
+class StubPageServer:
+    """Serves `text` as a plain-text page at /page, for the stand-in fetch tool to read."""
+
+    def __init__(self, text: str, port: int = 0) -> None:
+        self.text = text
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/page"
+
+    def start(self) -> "StubPageServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/page":
+                    self.send_error(404)
+                    return
+                body = stub.text.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+async def stub_fetch(url: str, max_length: int = 5000, start_index: int = 0, raw: bool = False) -> str:
+    """
+    The fetch tool of mcp-server-fetch, minus the HTML to markdown step: the
+    same header, paging by start_index and max_length, and end-of-page markers.
+    """
+    import httpx
+    async with httpx.AsyncClient(follow_redirects=True) as client:
+        response = await client.get(url)
+        response.raise_for_status()
+    content = response.text
+    if start_index >= len(content):
+        content = "<error>No more content available.</error>"
+    else:
+        page = content[start_index:start_index + max_length]
+        if start_index + len(page) < len(content):
+            page += (f"\n\n<error>Content truncated. Call the fetch tool with a start_index of "
+                     f"{start_index + len(page)} to get more content.</error>")
+        content = page
+    return f"Contents of {url}:\n{content}"
+
+
+def run_fetch_server() -> None:
+    """Run stub_fetch as the `fetch` tool of an MCP server over stdio."""
+    from mcp.server.fastmcp import FastMCP
+    mcp = FastMCP("fetch")
+    mcp.tool(name="fetch")(stub_fetch)
+    mcp.run(transport="stdio")
+
+
+def install_fake_arxiv() -> None:
+    """Make every arxiv.Client() in this process a FakeArxivClient."""
+    import arxiv
+    arxiv.Client = FakeArxivClient
+
+
+# A script maps the chat so far to the next reply: {"content": str} or
+# {"tool_calls": [(name, arguments dict), ...]}
+Script = Callable[[List[Dict]], Dict]
+
+
+class StubLLMServer:
+    """
+    OpenAI-compatible chat completions endpoint on localhost.
+
+    Replies come from `script`; streamed replies are sent as server-sent
+    events like the real API. Each request's size is recorded in
+    request_bytes.
+    """
+
+    def __init__(self, script: Script, latency: float = 0.05, port: int = 0) -> None:
+        """
+        Args:
+            script: Chooses the reply for a request's messages
+            latency: Seconds before the first chunk, standing in for model time
+            port: Port to listen on (0 picks a free one)
+        """
+        self.script = script
+        self.latency = latency
+        self.request_bytes: List[int] = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.request_bytes.append(len(body))
+                request = json.loads(body)
+                reply = stub.script(request["messages"])
+                time.sleep(stub.latency)
+                if request.get("stream"):
+                    self._stream(reply)
+                else:
+                    self._complete(reply)
+
+            def _send(self, status: int, content_type: str, payload: bytes, chunked: bool = False) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                if chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                else:
+                    self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                if payload:
+                    self.wfile.write(payload)
+
+            def _chunk(self, data: str) -> None:
+                raw = data.encode()
+                self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, reply: Dict) -> None:
+                self._send(200, "text/event-stream", b"", chunked=True)
+                for delta in _reply_deltas(reply):
+                    chunk = {
+                        "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                    }
+                    self._chunk(f"data: {json.dumps(chunk)}\n\n")
+                self._chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _complete(self, reply: Dict) -> None:
+                message = {"role": "assistant", "content": reply.get("content")}
+                if reply.get("tool_calls"):
+                    message["tool_calls"] = _tool_calls(reply)
+                payload = {
+                    "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+                    "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                }
+                self._send(200, "application/json", json.dumps(payload).encode())
+
+        return Handler
+
+
+def _tool_calls(reply: Dict) -> List[Dict]:
+    return [
+        {"id": f"call_{index}", "type": "function",
+         "function": {"name": name, "arguments": json.dumps(arguments)}}
+        for index, (name, arguments) in enumerate(reply.get("tool_calls", []))
+    ]
+
+
+def _reply_deltas(reply: Dict):
+    """Split a reply into streaming deltas: words of content, then each tool call in two pieces."""
+    if reply.get("content"):
+        for word in reply["content"].split(" "):
+            yield {"role": "assistant", "content": word + " "}
+    for index, call in enumerate(_tool_calls(reply)):
+        arguments = call["function"]["arguments"]
+        middle = len(arguments) // 2
+        yield {"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                               "function": {"name": call["function"]["name"], "arguments": arguments[:middle]}}]}
+        yield {"tool_calls": [{"index": index, "function": {"arguments": arguments[middle:]}}]}
+
+
+def create_research_app():
+    """research_server's HTTP app on the fake arXiv; the factory each worker process calls."""
+    install_fake_arxiv()
+    import research_server
+    return research_server.create_http_app()
+
+
+def run_research_server(transport: str = "stdio") -> None:
+    """Run research_server.py in this process with arXiv replaced by the fake."""
+    install_fake_arxiv()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import research_server
+    if transport == "streamable-http":
+        # WORKERS > 1 starts that many processes, each building its own app
+        research_server.run_http(app_factory="bench_stubs:create_research_app")
+    else:
+        research_server.mcp.run(transport=transport)
+
+
+if __name__ == "__main__":
+    # Corpus size and latency come from BENCH_CORPUS_SIZE and BENCH_ARXIV_LATENCY,
+    # the number of HTTP worker processes from WORKERS
+    if len(sys.argv) >= 2 and sys.argv[1] == "research":
+        run_research_server(sys.argv[2] if len(sys.argv) > 2 else "stdio")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "fetch":
+        run_fetch_server()
+    elif len(sys.argv) >= 2 and sys.argv[1] == "pdfs":
+        pdf_server = StubPDFServer(int(sys.argv[2]) if len(sys.argv) > 2 else 8001)
+        print(f"Serving fake papers' PDFs at {pdf_server.base_url}; set BENCH_PDF_URL to it")
+        pdf_server.serve_forever()
+    else:
+        print("Usage: python bench_stubs.py research [stdio|streamable-http] | pdfs [port] | fetch")
+        sys.exit(1)
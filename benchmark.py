@@ -0,0 +1,248 @@
+# Offline end-to-end benchmark: drives MCP_ChatBot.process_query and the
+# research_server tools against a fake arXiv and a scripted LLM stub, then
+# writes timings to a JSON file that can be compared across commits.
+#     python benchmark.py [--queries N] [--arxiv-latency S] [--output FILE]
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from bench_stubs import StubLLMServer, StubPDFServer, install_fake_arxiv
+from tracing import Span, tracer
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERY_PREFIX = "Find recent papers about "
+
+
+def research_script(max_results: int, extract_count: int):
+    """
+    Script for the stub LLM: search arXiv for the topic in the query, then
+    read a few of the papers found and search the local index, then answer.
+    """
+    def script(messages: List[Dict]) -> Dict:
+        topic = messages[0]["content"][len(QUERY_PREFIX):]
+        step = sum(1 for message in messages if message.get("role") == "assistant")
+        if step == 0:
+            return {"tool_calls": [("search_papers", {"topic": topic, "max_results": max_results})]}
+        if step == 1:
+            paper_ids = [line for line in messages[-1]["content"].splitlines() if line.strip()]
+            calls = [("extract_info", {"paper_id": paper_id}) for paper_id in paper_ids[:extract_count]]
+            calls.append(("search_local", {"query": topic, "k": 5}))
+            return {"tool_calls": calls}
+        return {"content": f"Here is a short overview of the papers about {topic}."}
+    return script
+
+
+def topics(count: int, distinct: int) -> List[str]:
+    """`count` query topics cycling through `distinct` different ones."""
+    words = ["graph neural networks", "quantum error correction", "diffusion models",
+             "federated learning", "causal inference", "sparse attention",
+             "robot control policies", "contrastive embeddings"]
+    return [f"{words[i % distinct % len(words)]} {i % distinct}" for i in range(count)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "total": round(sum(values), 6),
+        "mean": round(sum(values) / len(values), 6),
+        "p50": round(percentile(values, 0.5), 6),
+        "p95": round(percentile(values, 0.95), 6),
+        "p99": round(percentile(values, 0.99), 6),
+        "max": round(max(values), 6),
+    }
+
+
+def summarize_spans(spans: List[Span]) -> Dict[str, Dict]:
+    """Latency and payload totals per span name and target."""
+    groups: Dict[str, List[Span]] = {}
+    for span in spans:
+        groups.setdefault(f"{span.name}:{span.target}", []).append(span)
+    stages = {}
+    for key, group in sorted(groups.items()):
+        stage = summarize([span.duration for span in group])
+        stage["errors"] = sum(1 for span in group if span.error)
+        stage["request_bytes"] = sum(span.attrs.get("request_bytes", 0) for span in group)
+        stage["response_bytes"] = sum(span.attrs.get("response_bytes", 0) for span in group)
+        ttfts = [span.attrs["time_to_first_token"] for span in group if "time_to_first_token" in span.attrs]
+        if ttfts:
+            stage["time_to_first_token"] = summarize(ttfts)
+        stages[key] = stage
+    return stages
+
+
+def server_env(args) -> Dict[str, str]:
+    return {
+        "BENCH_ARXIV_LATENCY": str(args.arxiv_latency),
+        "BENCH_CORPUS_SIZE": str(args.corpus_size),
+        "PAPER_STORE": args.store,
+    }
+
+
+async def bench_chatbot(args, work_dir: str) -> Dict:
+    """Run scripted queries through the OpenRouter chatbot and a stdio research server."""
+    os.chdir(work_dir)
+    with open("server_config.json", "w") as file:
+        json.dump({"mcpServers": {"research": {
+            "command": sys.executable,
+            "args": [os.path.join(REPO_DIR, "bench_stubs.py"), "research"],
+            "env": server_env(args),
+        }}}, file)
+
+    import mcp_chatbot_openrouter as chatbot
+    from openai import AsyncOpenAI
+
+    # The real client is replaced below, but the constructor needs a key
+    os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+    stub = StubLLMServer(research_script(args.max_results, args.extract), latency=args.llm_latency).start()
+    bot = chatbot.MCP_ChatBot()
+    bot.openai_client = AsyncOpenAI(base_url=stub.base_url, api_key="bench")
+    tracer.spans.clear()
+
+    query_seconds = []
+    # The chatbot prints streamed replies; keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            started = time.perf_counter()
+            await bot.connect_to_servers()
+            connect_seconds = time.perf_counter() - started
+            for topic in topics(args.queries, args.distinct_topics):
+                started = time.perf_counter()
+                await bot.process_query(QUERY_PREFIX + topic)
+                query_seconds.append(time.perf_counter() - started)
+        finally:
+            await bot.cleanup()
+            stub.stop()
+
+    return {
+        "connect_seconds": round(connect_seconds, 6),
+        "wall_seconds": round(sum(query_seconds), 6),
+        "queries": summarize(query_seconds),
+        "llm_requests": len(stub.request_bytes),
+        "llm_request_bytes": summarize([float(size) for size in stub.request_bytes]),
+        "stages": summarize_spans(list(tracer.spans)),
+    }
+
+
+async def bench_tools(args, work_dir: str) -> Dict:
+    """Call the research_server tools and resources directly, in process."""
+    os.chdir(work_dir)
+    os.environ.update(server_env(args))
+    # Papers found from here on link to the local PDF stand-in
+    pdf_server = StubPDFServer().start()
+    os.environ["BENCH_PDF_URL"] = pdf_server.base_url
+    install_fake_arxiv()
+    import research_server
+
+    tracer.spans.clear()
+    started = time.perf_counter()
+    # search_papers prints where it saved results; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for topic in topics(args.queries, args.distinct_topics):
+            with tracer.span("research_server", "search_papers", request_bytes=len(topic)) as span:
+                paper_ids = await research_server.search_papers(topic, args.max_results)
+                span.set(response_bytes=len(json.dumps(paper_ids)))
+            for paper_id in paper_ids[:args.extract]:
+                with tracer.span("research_server", "extract_info", request_bytes=len(paper_id)) as span:
+                    span.set(response_bytes=len(research_server.extract_info(paper_id)))
+            if args.download:
+                download_ids = paper_ids[:args.download]
+                with tracer.span("research_server", "download_papers",
+                                 request_bytes=len(json.dumps(download_ids))) as span:
+                    statuses = await research_server.download_papers(download_ids)
+                    span.set(response_bytes=sum(status.get("text_bytes", 0) for status in statuses.values()))
+                with tracer.span("research_server", "get_paper_section", request_bytes=len(paper_ids[0])) as span:
+                    span.set(response_bytes=len(research_server.get_paper_section(paper_ids[0], "introduction")))
+            with tracer.span("research_server", "search_local", request_bytes=len(topic)) as span:
+                span.set(response_bytes=len(json.dumps(await research_server.search_local(topic, 5))))
+            with tracer.span("research_server", "papers://{topic}") as span:
+                span.set(response_bytes=len(research_server.get_topic_papers(topic.replace(" ", "_"))))
+            with tracer.span("research_server", "papers://folders") as span:
+                span.set(response_bytes=len(research_server.get_available_folders()))
+    wall_seconds = time.perf_counter() - started
+    pdf_server.stop()
+
+    return {
+        "wall_seconds": round(wall_seconds, 6),
+        "stages": summarize_spans(list(tracer.spans)),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def print_report(results: Dict) -> None:
+    for section in ("chatbot", "tools"):
+        if section not in results:
+            continue
+        data = results[section]
+        print(f"\n== {section}: {data['wall_seconds']:.3f}s wall")
+        if section == "chatbot":
+            print(f"connect {data['connect_seconds']:.3f}s, "
+                  f"query p50 {data['queries']['p50']:.3f}s p95 {data['queries']['p95']:.3f}s, "
+                  f"{data['llm_requests']} LLM requests, "
+                  f"{data['llm_request_bytes']['mean']:.0f} bytes each on average")
+        print(f"{'stage':45} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'total s':>9} {'req B':>9} {'resp B':>9}")
+        for key, stage in data["stages"].items():
+            print(f"{key[:45]:45} {stage['count']:6d} {stage['p50'] * 1000:9.1f} {stage['p95'] * 1000:9.1f} "
+                  f"{stage['total']:9.3f} {stage['request_bytes']:9d} {stage['response_bytes']:9d}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the chatbot and research server.")
+    parser.add_argument("--queries", type=int, default=10, help="queries to run")
+    parser.add_argument("--distinct-topics", type=int, default=10, help="different topics among the queries")
+    parser.add_argument("--max-results", type=int, default=5, help="papers per arXiv search")
+    parser.add_argument("--extract", type=int, default=3, help="extract_info calls per query")
+    parser.add_argument("--download", type=int, default=2, help="papers per query downloaded with download_papers (tools)")
+    parser.add_argument("--arxiv-latency", type=float, default=0.5, help="seconds per fake arXiv search")
+    parser.add_argument("--corpus-size", type=int, default=1000, help="papers in the fake arXiv corpus")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds before the stub LLM answers")
+    parser.add_argument("--store", choices=["json", "sqlite"], default="json", help="paper store backend")
+    parser.add_argument("--only", choices=["chatbot", "tools"], help="run one part only")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    args = parser.parse_args()
+    args.distinct_topics = max(1, min(args.distinct_topics, args.queries))
+    output = os.path.abspath(args.output)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "config": vars(args),
+    }
+    with tempfile.TemporaryDirectory(prefix="mcp-bench-") as work_dir:
+        if args.only in (None, "chatbot"):
+            os.makedirs(os.path.join(work_dir, "chatbot"))
+            results["chatbot"] = await bench_chatbot(args, os.path.join(work_dir, "chatbot"))
+        if args.only in (None, "tools"):
+            os.makedirs(os.path.join(work_dir, "tools"))
+            results["tools"] = await bench_tools(args, os.path.join(work_dir, "tools"))
+        os.chdir(REPO_DIR)
+
+    with open(output, "w") as file:
+        json.dump(results, file, indent=2)
+    print_report(results)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
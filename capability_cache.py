@@ -0,0 +1,43 @@
+import json
+import os
+from typing import Dict, Optional
+
+SNAPSHOT_FILE = ".mcp_capabilities.json"
+
+
+class CapabilitySnapshots:
+    """
+    Persists each server's discovered capabilities between chatbot runs.
+
+    Snapshots are keyed by the server's command and args and record the
+    server version reported at initialize. Each chatbot keeps its own
+    namespace, since they store tools in different (already cleaned) shapes.
+    """
+
+    def __init__(self, namespace: str, path: str = SNAPSHOT_FILE) -> None:
+        self.namespace = namespace
+        self.path = path
+
+    @staticmethod
+    def _key(server_config: Dict) -> str:
+        return json.dumps([server_config.get("command"), server_config.get("args", [])])
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def load(self, server_config: Dict) -> Optional[Dict]:
+        """Return the saved capabilities for a server, or None if there are none."""
+        return self._read().get(self.namespace, {}).get(self._key(server_config))
+
+    def save(self, server_config: Dict, capabilities: Dict) -> None:
+        """Store a server's capabilities, replacing any older snapshot."""
+        data = self._read()
+        data.setdefault(self.namespace, {})[self._key(server_config)] = capabilities
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(data, file, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,137 @@
+import json
+from typing import Dict, List
+
+# Rough size of a token for English text and JSON; good enough for budgeting
+CHARS_PER_TOKEN = 4
+# Fixed per-message overhead (role, separators) in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+# Start of the note that replaces dropped rounds
+DROPPED_NOTE_PREFIX = "Earlier steps were removed to save space. Tools already called: "
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate how many tokens a string takes without calling a tokenizer."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message: Dict) -> int:
+    """Estimate the size of one chat message, including its tool calls."""
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    content = message.get('content')
+    if isinstance(content, str):
+        tokens += estimate_tokens(content)
+    elif content:
+        tokens += estimate_tokens(json.dumps(content, default=str))
+    for tool_call in message.get('tool_calls') or []:
+        tokens += estimate_tokens(tool_call["function"]["name"] + tool_call["function"]["arguments"])
+    return tokens
+
+
+def shorten(text: str, max_tokens: int) -> str:
+    """Keep the start of text, marking how much was cut."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return (
+        text[:max_chars]
+        + f"\n[... truncated {len(text) - max_chars} of {len(text)} characters to stay within the context budget ...]"
+    )
+
+
+class ContextBudget:
+    """
+    Keeps the message list sent to the model under a token budget.
+
+    Tool results are truncated as they are added. Before each request, older
+    tool results are condensed first. If that isn't enough, whole older
+    rounds (an assistant message and its tool results) are replaced by a
+    one-line note of which tools were called. The original query and the
+    latest round are kept.
+    """
+
+    def __init__(self, max_tokens: int = 32000, max_tool_result_tokens: int = 4000,
+                 condensed_tool_result_tokens: int = 200) -> None:
+        """
+        Args:
+            max_tokens: Budget for the whole message list
+            max_tool_result_tokens: Budget for a single tool result when it is added
+            condensed_tool_result_tokens: Size older tool results are cut down to
+        """
+        self.max_tokens = max_tokens
+        self.max_tool_result_tokens = max_tool_result_tokens
+        self.condensed_tool_result_tokens = condensed_tool_result_tokens
+
+    def tool_result(self, text: str) -> str:
+        """Truncate a tool result to the per-result budget."""
+        return shorten(text, self.max_tool_result_tokens)
+
+    def total_tokens(self, messages: List[Dict]) -> int:
+        return sum(message_tokens(message) for message in messages)
+
+    @staticmethod
+    def _rounds(messages: List[Dict]) -> List[List[int]]:
+        """Group message indexes so each tool message stays with the call that produced it."""
+        rounds = []
+        for index, message in enumerate(messages):
+            if message.get('role') == 'tool' and rounds:
+                rounds[-1].append(index)
+            else:
+                rounds.append([index])
+        return rounds
+
+    def _condense_tool_results(self, messages: List[Dict], indexes: List[int], total: int) -> int:
+        for index in indexes:
+            if total <= self.max_tokens:
+                break
+            message = messages[index]
+            if message.get('role') != 'tool' or not isinstance(message.get('content'), str):
+                continue
+            before = message_tokens(message)
+            message['content'] = shorten(message['content'], self.condensed_tool_result_tokens)
+            total -= before - message_tokens(message)
+        return total
+
+    def compact(self, messages: List[Dict]) -> None:
+        """Shrink messages in place until they fit the budget (or only protected ones remain)."""
+        total = self.total_tokens(messages)
+        if total <= self.max_tokens:
+            return
+
+        rounds = self._rounds(messages)
+        # The first round is the user's query, the last is what the model just did
+        older = [index for group in rounds[1:-1] for index in group]
+
+        # 1. Condense older tool results, oldest first
+        total = self._condense_tool_results(messages, older, total)
+        if total <= self.max_tokens:
+            return
+
+        # 2. Replace the oldest rounds with a note of which tools were called
+        dropped = []
+        calls = []
+        for group in rounds[1:-1]:
+            if total <= self.max_tokens:
+                break
+            for index in group:
+                message = messages[index]
+                total -= message_tokens(message)
+                # Carry over the list from a note left by an earlier compaction
+                if message.get('role') == 'system' and message.get('content', '').startswith(DROPPED_NOTE_PREFIX):
+                    calls.append(message['content'][len(DROPPED_NOTE_PREFIX):].split("\n[... truncated")[0])
+                for tool_call in message.get('tool_calls') or []:
+                    calls.append(f"{tool_call['function']['name']}({tool_call['function']['arguments']})")
+            dropped.extend(group)
+        if dropped:
+            note = {
+                'role': 'system',
+                'content': shorten(
+                    DROPPED_NOTE_PREFIX + (", ".join(calls) or "none"),
+                    self.condensed_tool_result_tokens,
+                ),
+            }
+            total += message_tokens(note)
+            messages[dropped[0]:dropped[-1] + 1] = [note]
+
+        # 3. Last resort: condense the latest round's tool results too
+        if total > self.max_tokens:
+            self._condense_tool_results(messages, self._rounds(messages)[-1], total)
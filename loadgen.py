@@ -0,0 +1,242 @@
+# Load generator for the streamable-http research server: N concurrent MCP
+# sessions issue a weighted mix of search_papers, extract_info and papers://
+# reads, then throughput, latency percentiles and errors are reported.
+#     python loadgen.py --spawn --clients 20 --duration 30
+#     python loadgen.py --spawn --workers 4 --store sqlite
+#     python loadgen.py --url http://host:8000/mcp --mix search_papers=1,extract_info=5,read_topic=4
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+from benchmark import summarize, topics
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+OPERATIONS = ("search_papers", "extract_info", "read_topic", "read_folders")
+DEFAULT_MIX = "search_papers=1,extract_info=4,read_topic=4,read_folders=1"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse "op=weight,..." into weights, rejecting unknown operations."""
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}'; choose from {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    if not any(weights.values()):
+        raise ValueError("At least one operation needs a positive weight")
+    return weights
+
+
+class LoadState:
+    """What the clients share: the topic pool, paper IDs seen so far and the samples."""
+
+    def __init__(self, topic_pool: List[str], fresh_searches: float) -> None:
+        self.topics = topic_pool
+        # Share of searches for a topic nobody asked for yet, so they reach arXiv
+        self.fresh_searches = fresh_searches
+        self.session_errors = 0
+        self.paper_ids: List[str] = []
+        self.latencies: Dict[str, List[float]] = {name: [] for name in OPERATIONS}
+        self.errors: Dict[str, int] = {name: 0 for name in OPERATIONS}
+        self.error_samples: List[str] = []
+
+
+async def run_operation(session: ClientSession, operation: str, state: LoadState, rng: random.Random,
+                        max_results: int) -> None:
+    topic = rng.choice(state.topics)
+    if operation == "search_papers":
+        if rng.random() < state.fresh_searches:
+            topic = f"{topic} {rng.randrange(10 ** 9)}"
+        result = await session.call_tool("search_papers", {"topic": topic, "max_results": max_results})
+        if not result.isError:
+            state.paper_ids.extend(item.text for item in result.content if hasattr(item, "text"))
+    elif operation == "extract_info":
+        result = await session.call_tool("extract_info", {"paper_id": rng.choice(state.paper_ids)})
+    elif operation == "read_topic":
+        result = await session.read_resource(f"papers://{topic.replace(' ', '_')}")
+    else:
+        result = await session.read_resource("papers://folders")
+    if getattr(result, "isError", False):
+        raise RuntimeError(" ".join(getattr(item, "text", "") for item in result.content))
+
+
+async def client(url: str, state: LoadState, weights: Dict[str, float], deadline: float,
+                 seed: int, max_results: int) -> None:
+    """One MCP session issuing operations back to back until the deadline."""
+    rng = random.Random(seed)
+    names = list(weights)
+    try:
+        async with streamablehttp_client(url) as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                while time.perf_counter() < deadline:
+                    operation = rng.choices(names, weights=[weights[name] for name in names])[0]
+                    if operation == "extract_info" and not state.paper_ids:
+                        operation = "search_papers"
+                    started = time.perf_counter()
+                    try:
+                        await run_operation(session, operation, state, rng, max_results)
+                        state.latencies[operation].append(time.perf_counter() - started)
+                    except Exception as e:
+                        state.errors[operation] += 1
+                        if len(state.error_samples) < 5:
+                            state.error_samples.append(f"{operation}: {e}")
+    except Exception as e:
+        # A session that can't connect (or drops) shouldn't stop the others
+        state.session_errors += 1
+        if len(state.error_samples) < 5:
+            state.error_samples.append(f"session: {e}")
+
+
+async def warm_up(url: str, state: LoadState, max_results: int) -> None:
+    """Search every topic once so reads have papers to return."""
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            for topic in state.topics:
+                result = await session.call_tool("search_papers", {"topic": topic, "max_results": max_results})
+                state.paper_ids.extend(item.text for item in result.content if hasattr(item, "text"))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"research server did not listen on port {port} within {timeout}s")
+
+
+def spawn_server(args, work_dir: str, port: int) -> subprocess.Popen:
+    """Start research_server.py on the fake arXiv in work_dir, listening on port."""
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "BENCH_ARXIV_LATENCY": str(args.arxiv_latency),
+        "BENCH_CORPUS_SIZE": str(args.corpus_size),
+        "PAPER_STORE": args.store,
+        "WORKERS": str(args.workers),
+    }
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, "bench_stubs.py"), "research", "streamable-http"],
+        cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, 30)
+    except TimeoutError:
+        process.kill()
+        raise
+    return process
+
+
+async def run_load(args, url: str) -> Dict:
+    state = LoadState(topics(args.topics, args.topics), args.fresh_searches)
+    weights = parse_mix(args.mix)
+    await warm_up(url, state, args.max_results)
+
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(
+        client(url, state, weights, deadline, seed, args.max_results) for seed in range(args.clients)
+    ))
+    elapsed = time.perf_counter() - started
+
+    operations = {}
+    for name in OPERATIONS:
+        samples = state.latencies[name]
+        if not samples and not state.errors[name]:
+            continue
+        stats = summarize(samples) if samples else {"count": 0}
+        stats["throughput"] = round(len(samples) / elapsed, 3)
+        stats["errors"] = state.errors[name]
+        operations[name] = stats
+    completed = sum(len(samples) for samples in state.latencies.values())
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "completed": completed,
+        "errors": sum(state.errors.values()),
+        "session_errors": state.session_errors,
+        "throughput": round(completed / elapsed, 3),
+        "operations": operations,
+        "error_samples": state.error_samples,
+    }
+
+
+def print_report(results: Dict) -> None:
+    print(f"\n{results['completed']} operations in {results['elapsed_seconds']:.1f}s "
+          f"({results['throughput']:.1f}/s), {results['errors']} errors, "
+          f"{results['session_errors']} failed sessions")
+    print(f"{'operation':14} {'count':>7} {'ops/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, stats in results["operations"].items():
+        if stats["count"]:
+            print(f"{name:14} {stats['count']:7d} {stats['throughput']:8.1f} {stats['p50'] * 1000:9.1f} "
+                  f"{stats['p95'] * 1000:9.1f} {stats['p99'] * 1000:9.1f} {stats['errors']:7d}")
+        else:
+            print(f"{name:14} {0:7d} {0:8.1f} {'-':>9} {'-':>9} {'-':>9} {stats['errors']:7d}")
+    for sample in results["error_samples"]:
+        print(f"  error: {sample}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the streamable-http research server.")
+    parser.add_argument("--url", help="server endpoint, e.g. http://127.0.0.1:8000/mcp")
+    parser.add_argument("--spawn", action="store_true", help="start a research server on a fake arXiv for the run")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent MCP sessions")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load after warm-up")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--topics", type=int, default=8, help="distinct topics searched and read")
+    parser.add_argument("--fresh-searches", type=float, default=0.25,
+                        help="share of searches for new topics (the rest hit the search cache)")
+    parser.add_argument("--max-results", type=int, default=5, help="papers per search")
+    parser.add_argument("--arxiv-latency", type=float, default=0.5, help="seconds per fake arXiv search (--spawn)")
+    parser.add_argument("--corpus-size", type=int, default=1000, help="papers in the fake arXiv corpus (--spawn)")
+    parser.add_argument("--store", choices=["json", "sqlite"], default="json", help="paper store backend (--spawn)")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes (--spawn)")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    if not args.url and not args.spawn:
+        parser.error("give --url or --spawn")
+
+    results = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "config": vars(args)}
+    if args.spawn:
+        with tempfile.TemporaryDirectory(prefix="mcp-load-") as work_dir:
+            port = free_port()
+            process = spawn_server(args, work_dir, port)
+            try:
+                results.update(await run_load(args, f"http://127.0.0.1:{port}/mcp"))
+            finally:
+                process.terminate()
+                process.wait()
+    else:
+        results.update(await run_load(args, args.url))
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,162 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List
+
+# Words too common to help ranking
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "we", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into alphanumeric terms, dropping stopwords."""
+    return [term for term in re.findall(r"[a-z0-9]+", text.lower()) if term not in STOPWORDS]
+
+
+class LocalSearchIndex:
+    """
+    On-disk inverted index with BM25 ranking over stored papers.
+
+    Indexes title, authors and summary. Titles are counted twice so a match
+    there outranks one buried in a summary. Papers are added incrementally;
+    re-adding a paper replaces its old postings.
+    """
+
+    # Standard BM25 parameters
+    K1 = 1.2
+    B = 0.75
+    TITLE_WEIGHT = 2
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS docs (
+            paper_id TEXT PRIMARY KEY,
+            length INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            published TEXT
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            term TEXT NOT NULL,
+            paper_id TEXT NOT NULL,
+            tf INTEGER NOT NULL,
+            PRIMARY KEY (term, paper_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value REAL NOT NULL
+        );
+        INSERT OR IGNORE INTO meta VALUES ('doc_count', 0), ('total_length', 0), ('backfilled', 0);
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, conn: sqlite3.Connection, key: str) -> float:
+        return conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def add_papers(self, papers: Dict[str, dict]) -> None:
+        """Index (or re-index) papers given as {paper_id: info}."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for paper_id, info in papers.items():
+                terms = Counter(tokenize(info.get('title', '')))
+                for term in terms:
+                    terms[term] *= self.TITLE_WEIGHT
+                terms.update(tokenize(" ".join(info.get('authors', []))))
+                terms.update(tokenize(info.get('summary', '')))
+                length = sum(terms.values())
+
+                old = conn.execute(
+                    "SELECT length FROM docs WHERE paper_id = ?", (paper_id,)
+                ).fetchone()
+                if old is not None:
+                    conn.execute("DELETE FROM postings WHERE paper_id = ?", (paper_id,))
+                    conn.execute(
+                        "UPDATE meta SET value = value - ? WHERE key = 'total_length'", (old[0],)
+                    )
+                else:
+                    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'doc_count'")
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)",
+                    (paper_id, length, info.get('title', ''), info.get('published')),
+                )
+                conn.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    [(term, paper_id, tf) for term, tf in terms.items()],
+                )
+                conn.execute(
+                    "UPDATE meta SET value = value + ? WHERE key = 'total_length'", (length,)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def is_backfilled(self) -> bool:
+        """Whether papers stored before the index existed have been added."""
+        return bool(self._meta(self._connect(), 'backfilled'))
+
+    def mark_backfilled(self) -> None:
+        self._connect().execute("UPDATE meta SET value = 1 WHERE key = 'backfilled'")
+
+    def search(self, query: str, k: int = 10) -> List[dict]:
+        """
+        Rank indexed papers against a query with BM25.
+
+        Returns:
+            Up to k dicts with paper_id, title, published and score, best first
+        """
+        conn = self._connect()
+        doc_count = self._meta(conn, 'doc_count')
+        if not doc_count:
+            return []
+        avg_length = self._meta(conn, 'total_length') / doc_count
+
+        scores = Counter()
+        for term in set(tokenize(query)):
+            rows = conn.execute(
+                """SELECT p.paper_id, p.tf, d.length FROM postings p
+                   JOIN docs d USING (paper_id) WHERE p.term = ?""",
+                (term,),
+            ).fetchall()
+            if not rows:
+                continue
+            df = len(rows)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for paper_id, tf, length in rows:
+                norm = self.K1 * (1 - self.B + self.B * length / avg_length)
+                scores[paper_id] += idf * tf * (self.K1 + 1) / (tf + norm)
+
+        results = []
+        for paper_id, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            title, published = conn.execute(
+                "SELECT title, published FROM docs WHERE paper_id = ?", (paper_id,)
+            ).fetchone()
+            results.append({
+                'paper_id': paper_id,
+                'title': title,
+                'published': published,
+                'score': round(score, 4),
+            })
+        return results
@@ -1,18 +1,19 @@
 import os
 import json
-import re
 import google.generativeai as genai
 from urllib import response
 from dotenv import load_dotenv
 from anthropic import Anthropic
-from mcp import ClientSession, StdioServerParameters, types
-from mcp.client.stdio import stdio_client
+from mcp import ClientSession, types
 from typing import List,Dict,TypedDict
-from contextlib import AsyncExitStack
+from capability_cache import CapabilitySnapshots
+from server_process import ServerProcess
+from paged_fetch import fetch_all_pages
+from tracing import debug, payload_bytes, traced, tracer
+from tool_cache import ToolResultCache
 import asyncio
 import nest_asyncio
 import traceback
-from pprint import pprint
 
 
 
@@ -22,6 +23,12 @@ from pprint import pprint
 load_dotenv()
 genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
 
+# Maximum number of tool calls running at once on a single server session
+SESSION_CONCURRENCY = int(os.environ.get("MCP_SESSION_CONCURRENCY", 4))
+# Most characters of a fetched page to assemble, and how many pages to request at once
+FETCH_MAX_CHARS = int(os.environ.get("FETCH_MAX_CHARS", 40000))
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", 4))
+
 def clean_schema(d):
     if isinstance(d, dict):
         d.pop('title', None)
@@ -45,75 +52,256 @@ class ToolDefinition(TypedDict):
     parameters:dict
             
 
-def response_has_tool_call(response):
-    if response and response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'function_call') and part.function_call.name:
-                return True
-    return False
+def part_is_function_call(part):
+    return hasattr(part, 'function_call') and bool(part.function_call.name)
 
 class MCP_ChatBot:
 
     def __init__(self) -> None:
         # Initialize session and client objects
-        self.sessions: List[ClientSession] = []
         self.available_tools: List[ToolDefinition] = []
-        self.tool_to_session: Dict[str, ClientSession] = {}
+        self.tool_to_session: Dict[str, ServerProcess] = {}
+
+        # Configured servers in config order, and the capabilities of each
+        # usable one (live or from a snapshot)
+        self.servers: Dict[str, ServerProcess] = {}
+        self.server_capabilities: Dict[str, Dict] = {}
+        self.background_tasks: List[asyncio.Task] = []
+        self.snapshots = CapabilitySnapshots("gemini")
+
+        # Per-server caps on concurrent tool calls
+        self.session_limits: Dict[ServerProcess, asyncio.Semaphore] = {}
+
+        # Results of idempotent tool calls and resource reads, configured by
+        # the "toolCache" section of server_config.json
+        self.tool_cache = ToolResultCache()
+
 
-        self.exit_stack = AsyncExitStack()
-        
         self.gemini_client = genai.GenerativeModel('gemini-2.5-flash')
 
         # self.session: ClientSession
         # self.available_tools: List[dict] = []
 
-    async def connect_to_server(self, server_name: str, server_config: dict) -> None:
-        """Connect to a single MCP server."""
-        try:
-            server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
-            ) # new 
-
-            await session.initialize()
-            self.sessions.append(session)
-
-                        # List available tools for this session
-            response = await session.list_tools()
-            tools = response.tools
-            print(f"\nConnected to {server_name} with tools:", [t.name for t in tools])
-            
-            for tool in tools: # new
-                self.tool_to_session[tool.name] = session
-                self.available_tools.append({
-                    "name": tool.name,
-                    "description": tool.description if tool.description else "",
-                    "parameters": tool.inputSchema
-                })
-
-        except Exception as e:
-            print(f"Failed to connect to {server_name}: {e}")
+    async def discover_server(self, session: ClientSession, server_name: str = "") -> Dict:
+        """
+        Initialize a session and list its tools.
+
+        Returns:
+            JSON-serializable capabilities: version and tools (with cleaned schemas)
+        """
+        init_result = await traced("initialize", server_name, session.initialize())
+        response = await traced("list_tools", server_name, session.list_tools())
+        tools = [
+            {
+                "name": tool.name,
+                "description": tool.description if tool.description else "",
+                "parameters": tool.inputSchema
+            }
+            for tool in response.tools
+        ]
+        clean_schema(tools)
+        return {"version": init_result.serverInfo.version, "tools": tools}
+
+    def rebuild_registry(self) -> None:
+        """Recompute the tool map from every usable server, in config order."""
+        self.available_tools = []
+        self.tool_to_session = {}
+
+        for server_name, server in self.servers.items():
+            if server_name not in self.server_capabilities:
+                continue
+
+            for tool in self.server_capabilities[server_name]["tools"]: # new
+                self.tool_to_session[tool["name"]] = server
+                self.available_tools.append(tool)
+
+    def server_discovered(self, server: ServerProcess, capabilities: Dict) -> None:
+        """Record the capabilities a server reported when it (re)started."""
+        print(f"\nConnected to {server.name} in {server.startup_seconds:.2f}s with tools:", [t["name"] for t in capabilities["tools"]])
+        self.snapshots.save(server.config, capabilities)
+        previous = self.server_capabilities.get(server.name)
+        self.server_capabilities[server.name] = capabilities
+        if previous is not None and previous != capabilities:
+            print(f"\n{server.name} capabilities changed since the last run; updated")
+            self.rebuild_registry()
+
+    async def revalidate_server(self, server: ServerProcess) -> None:
+        """Finish a warm-started server's handshake, dropping it if it fails."""
+        if await server.start() is None:
+            print(f"\n{server.name} failed to start; its tools are no longer available")
+            self.server_capabilities.pop(server.name, None)
+            self.rebuild_registry()
 
     async def connect_to_servers(self): # new
-        """Connect to all configured MCP servers."""
+        """
+        Connect to all configured MCP servers concurrently.
+
+        Each server may set "timeout" (seconds) in server_config.json; the
+        default comes from MCP_SERVER_TIMEOUT. A server that fails or times
+        out is skipped without holding up the others.
+
+        Servers with a capability snapshot from an earlier run are usable
+        immediately; their handshake finishes and is checked against the
+        snapshot in the background.
+
+        Lazy servers ("lazy": true, or MCP_LAZY_SERVERS=1 for all) with a
+        snapshot aren't started until one of their tools is used, and are
+        stopped again after "idleTimeout" seconds without use (default
+        MCP_IDLE_TIMEOUT).
+        """
         try:
             with open("server_config.json", "r") as file:
                 data = json.load(file)
             
             servers = data.get("mcpServers", {})
-            
-            for server_name, server_config in servers.items():
-                await self.connect_to_server(server_name, server_config)
-            clean_schema(self.available_tools)
-            print(f"        [Debug] cleaned available_tools: {self.available_tools}")
+            self.tool_cache = ToolResultCache.from_config(data.get("toolCache", {}))
         except Exception as e:
             print(f"Error loading server configuration: {e}")
             raise
+
+        default_timeout = float(os.environ.get("MCP_SERVER_TIMEOUT", 30))
+        default_lazy = os.environ.get("MCP_LAZY_SERVERS", "").lower() in ("1", "true", "yes")
+        default_idle_timeout = float(os.environ.get("MCP_IDLE_TIMEOUT", 300))
+
+        cold = []
+        for server_name, server_config in servers.items():
+            lazy = server_config.get("lazy", default_lazy)
+            server = ServerProcess(
+                server_name,
+                server_config,
+                self.discover_server,
+                timeout=server_config.get("timeout", default_timeout),
+                idle_timeout=server_config.get("idleTimeout", default_idle_timeout) if lazy else None,
+                on_discovered=self.server_discovered,
+            )
+            self.servers[server_name] = server
+
+            # Servers seen on an earlier run start from their snapshot
+            snapshot = self.snapshots.load(server_config)
+            if snapshot is None:
+                cold.append(server)
+                continue
+            self.server_capabilities[server_name] = snapshot
+            if lazy:
+                print(f"\n{server_name} will start on first use; tools from snapshot:", [t["name"] for t in snapshot["tools"]])
+            else:
+                print(f"\nLoaded {server_name} from snapshot with tools:", [t["name"] for t in snapshot["tools"]])
+                self.background_tasks.append(asyncio.create_task(self.revalidate_server(server)))
+
+        # The rest have to be started to learn what they offer; their
+        # handshakes overlap, so the wait is as long as the slowest one
+        await asyncio.gather(*(server.start() for server in cold))
+
+        # Register in config order so the tool list sent to the model is stable
+        self.rebuild_registry()
+        debug(f"        [Debug] cleaned available_tools: {self.available_tools}")
     
+    async def call_tool(self, tool_name: str, arguments: dict):
+        """
+        Call a tool on its server, limiting how many calls each server runs
+        at once and reusing cached results of idempotent tools. A lazy server
+        is started by its first call.
+        """
+        server = self.tool_to_session[tool_name]
+        with tracer.span("call_tool", tool_name, request_bytes=payload_bytes(arguments)) as span:
+            cached = self.tool_cache.get_tool(server, tool_name, arguments)
+            if cached is not None:
+                debug(f"[DEBUG] [cache hit] {tool_name} {arguments}")
+                span.set(cached=True, response_bytes=payload_bytes(cached))
+                return cached
+
+            limit = self.session_limits.get(server)
+            if limit is None:
+                limit = self.session_limits[server] = asyncio.Semaphore(SESSION_CONCURRENCY)
+            # A mutating call that finishes while this one runs moves the epoch on
+            epoch = self.tool_cache.epoch(server)
+            try:
+                async with limit, server.use() as session:
+                    result = await session.call_tool(tool_name, arguments=arguments) # type: ignore
+            finally:
+                # A mutating tool may have changed what cached results would return
+                if tool_name in self.tool_cache.mutating_tools:
+                    self.tool_cache.invalidate(server)
+            self.tool_cache.put_tool(server, tool_name, arguments, result, epoch)
+            span.set(cached=False, response_bytes=payload_bytes(result), is_error=bool(result.isError))
+            return result
+
+    async def fetch_page(self, arguments: dict) -> str:
+        """Call the fetch tool once and return its text, raising if it reports an error."""
+        result = await self.call_tool('fetch', arguments)
+        text = "\n".join(item.text for item in result.content if hasattr(item, 'text'))
+        if result.isError:
+            raise RuntimeError(text)
+        return text
+
+    async def run_tool_call(self, tool_call) -> List[str]:
+        """Run one function_call part from the model and return its text content."""
+        tool_name = tool_call.function_call.name
+        tool_args = tool_call.function_call.args
+        tool_args_dict = dict(tool_args)
+        debug(f"[DEBUG] Calling tool {tool_name} with args {tool_args_dict}")
+        try:
+            if tool_name == 'fetch':
+                # Long pages come back in pieces; assemble them into one result
+                text = await fetch_all_pages(self.fetch_page, tool_args_dict, FETCH_MAX_CHARS, FETCH_CONCURRENCY)
+                debug(f"[DEBUG] Tool result: {len(text)} characters")
+                return [text]
+            result = await self.call_tool(tool_name, tool_args_dict)
+            debug(f"[DEBUG] Tool result: {result}")
+        except Exception as e:
+            # Report the failure to the model instead of dropping the other results
+            print(f"Tool {tool_name} failed: {e}")
+            return [f"Error calling tool {tool_name}: {e}"]
+
+        return [item.text for item in result.content]
+
+    async def stream_generate(self, messages, tools=None):
+        """
+        Stream one Gemini generation without blocking the event loop.
+
+        Text is printed as it arrives. Each function_call part is dispatched
+        to its server as soon as it arrives, so tools run while the model is
+        still generating.
+
+        Returns:
+            All parts of the model's reply and a list of (function_call part, task) pairs in call order
+        """
+        span = tracer.start(
+            "llm_request", self.gemini_client.model_name,
+            request_bytes=payload_bytes(messages) + payload_bytes(tools),
+        )
+        parts = []
+        tool_calls = []
+        printed_text = False
+        try:
+            response = await self.gemini_client.generate_content_async(
+                contents=messages, # type: ignore
+                tools=tools, # type: ignore
+                stream=True,
+            )
+            async for chunk in response:
+                if not (chunk.candidates and chunk.candidates[0].content):
+                    continue
+                span.first_token()
+                for part in chunk.candidates[0].content.parts:
+                    parts.append(part)
+                    if part_is_function_call(part):
+                        tool_calls.append((part, asyncio.create_task(self.run_tool_call(part))))
+                    elif part.text:
+                        print(part.text, end="", flush=True)
+                        printed_text = True
+        except BaseException as e:
+            for _, task in tool_calls:
+                task.cancel()
+            tracer.finish(span, e)
+            raise
+
+        if printed_text:
+            print()
+        span.set(response_bytes=payload_bytes(parts), tool_calls=len(tool_calls))
+        tracer.finish(span)
+        return parts, tool_calls
+
     async def process_query(self, query):
         messages = [
             {'role':'user',
@@ -121,57 +309,31 @@ class MCP_ChatBot:
              }
         ]
 
-        response = self.gemini_client.generate_content(
-            contents=messages, # type: ignore
-            tools=[{"function_declarations": self.available_tools}], # type: ignore
+        parts, tool_calls = await self.stream_generate(
+            messages, tools=[{"function_declarations": self.available_tools}]
         )
         
-        print(f"[DEBUG] First response: {response}")
-
-        message = response.candidates[0].content.parts[0]
-        messages.append({'role': 'model', 'parts': response.candidates[0].content.parts})
-
-        if response_has_tool_call(response):
-            tool_calls = response.candidates[0].content.parts
-            print(f"[DEBUG] Tool calls: {tool_calls}")
-
-            for tool_call in tool_calls:
-                if hasattr(tool_call, 'function_call'):
-                    tool_name = tool_call.function_call.name
-                    tool_args = tool_call.function_call.args
-                    tool_args_dict = dict(tool_args)
-                    print(f"[DEBUG] Calling tool {tool_name} with args {tool_args_dict}")
-
-                    session = self.tool_to_session[tool_name]
-                    result = await session.call_tool(tool_name,arguments=tool_args_dict) # type: ignore
-                    print(f"[DEBUG] Tool result: {result}")
-
-                    if tool_name == 'fetch' and result.content and '<error>Content truncated.' in result.content[0].text:
-                        match = re.search(r'start_index of (\d+)', result.content[0].text)
-                        if match:
-                            start_index = int(match.group(1))
-                            tool_args_dict['start_index'] = start_index
-                            result = await session.call_tool(tool_name,arguments=tool_args_dict) # type: ignore
-                            print(f"[DEBUG] Tool result (refetched): {result}")
-
-
-                    messages.append({
-                        'role': 'tool',
-                        'parts': [{'function_response': {'name': tool_name, 'response': {'content': [item.text for item in result.content]}}}]
-                    })
+        debug(f"[DEBUG] First response parts: {parts}")
+
+        messages.append({'role': 'model', 'parts': parts})
+
+        if tool_calls:
+            # The calls were started while streaming; collect the results in
+            # the order the model asked for them
+            results = await asyncio.gather(*(task for _, task in tool_calls))
+
+            for (tool_call, _), content in zip(tool_calls, results):
+                messages.append({
+                    'role': 'tool',
+                    'parts': [{'function_response': {'name': tool_call.function_call.name, 'response': {'content': content}}}]
+                })
             
-            pprint(f"[DEBUG] Messages before second call: {messages}")
-            response = self.gemini_client.generate_content(
-                contents=messages
-            )
-            pprint(f"[DEBUG] Second response: {response}")
+            debug(f"[DEBUG] Messages before second call: {messages}")
+            parts, _ = await self.stream_generate(messages)
+            debug(f"[DEBUG] Second response parts: {parts}")
             
-            if response.candidates and response.candidates[0].content and response.candidates[0].content.parts and len(response.candidates[0].content.parts) > 0:
-                messages.append(response.candidates[0].content)
-                print(response.candidates[0].content.parts[0].text)
-        else:
-            if message and message.text:
-                print(message.text)
+            if parts:
+                messages.append({'role': 'model', 'parts': parts})
 
     async def chat_loop(self):
         """Run an interactive chat loop"""
@@ -192,7 +354,10 @@ class MCP_ChatBot:
                 traceback.print_exc()
 
     async def cleanup(self):
-        await self.exit_stack.aclose()
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*(server.stop() for server in self.servers.values()))
+        tracer.write_metrics()
 
     # async def connect_to_server_and_run(self):
     #     # Create server parameters for stdio connection
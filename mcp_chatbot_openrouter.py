@@ -1,17 +1,20 @@
 import os
 import json
-from openai import OpenAI
+from openai import AsyncOpenAI
 from urllib import response
 from dotenv import load_dotenv
 from anthropic import Anthropic
-from mcp import ClientSession, StdioServerParameters, types
-from mcp.client.stdio import stdio_client
+from mcp import ClientSession, types
 from typing import List,Dict,TypedDict
-from contextlib import AsyncExitStack
+from capability_cache import CapabilitySnapshots
+from server_process import ServerProcess
+from paged_fetch import fetch_all_pages
+from tracing import debug, payload_bytes, traced, tracer
+from tool_cache import ToolResultCache
+from context_budget import CHARS_PER_TOKEN, ContextBudget
 import asyncio
 import nest_asyncio
 import traceback
-from pprint import pprint
 
 
 
@@ -23,6 +26,12 @@ load_dotenv()
 free_model = "x-ai/grok-4-fast:free"
 # free_model = "deepseek/deepseek-chat-v3.1:free"
 
+# Maximum number of tool calls running at once on a single server session
+SESSION_CONCURRENCY = int(os.environ.get("MCP_SESSION_CONCURRENCY", 4))
+# Most characters of a fetched page to assemble, and how many pages to request at once
+FETCH_MAX_CHARS = int(os.environ.get("FETCH_MAX_CHARS", 40000))
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", 4))
+
 class ToolDefinition(TypedDict):
     name:str
     description: str
@@ -32,24 +41,121 @@ class MCP_ChatBot:
 
     def __init__(self) -> None:
         # Initialize session and client objects
-        self.session_list: List[ClientSession] = []
         # self.available_tools: List[Dict] = []
         self.tool_to_session: Dict[str, ClientSession] = {}
 
-        # Tools, Resource and Prompts to session
-        self.sessions:Dict = {}
+        # Tools, Resource and Prompts to the server that provides them
+        self.sessions: Dict[str, ServerProcess] = {}
 
         self.available_tools: List[Dict] = []
         self.available_prompts: List[Dict] = []
 
-        self.exit_stack = AsyncExitStack()
-        
-        self.openai_client = OpenAI(
+        # Configured servers in config order, and the capabilities of each
+        # usable one (live or from a snapshot)
+        self.servers: Dict[str, ServerProcess] = {}
+        self.server_capabilities: Dict[str, Dict] = {}
+        self.background_tasks: List[asyncio.Task] = []
+        self.snapshots = CapabilitySnapshots("openrouter")
+
+        # Per-server caps on concurrent tool calls
+        self.session_limits: Dict[ServerProcess, asyncio.Semaphore] = {}
+
+        # Results of idempotent tool calls and resource reads, configured by
+        # the "toolCache" section of server_config.json
+        self.tool_cache = ToolResultCache()
+
+        # Keeps the messages resent on every tool round under a token budget
+        self.context_budget = ContextBudget(
+            max_tokens=int(os.environ.get("CONTEXT_MAX_TOKENS", 32000)),
+            max_tool_result_tokens=int(os.environ.get("TOOL_RESULT_MAX_TOKENS", 4000)),
+        )
+
+        self.openai_client = AsyncOpenAI(
             base_url="https://openrouter.ai/api/v1",
             api_key=os.environ.get("OPENROUTER_API_KEY"),
         )
 
     
+    async def stream_completion(self, messages):
+        """
+        Stream one chat completion, printing text as it arrives.
+
+        Tool calls are assembled from their deltas and each one is started as
+        soon as it is complete (when the next call begins or the stream ends),
+        so tools run while the model is still generating.
+
+        Returns:
+            The assistant message dict and a list of (tool call, task) pairs in call order
+        """
+        span = tracer.start(
+            "llm_request", free_model,
+            request_bytes=payload_bytes(messages) + payload_bytes(self.available_tools),
+        )
+        content_parts = []
+        calls: Dict[int, Dict] = {}
+        tasks: Dict[int, asyncio.Task] = {}
+
+        def start_pending_calls() -> None:
+            for index, call in calls.items():
+                if index not in tasks:
+                    tasks[index] = asyncio.create_task(
+                        self.run_tool_call(call["function"]["name"], call["function"]["arguments"])
+                    )
+
+        try:
+            stream = await self.openai_client.chat.completions.create(
+                model=free_model,
+                messages=messages, # type: ignore
+                tools=self.available_tools, # type: ignore
+                stream=True,
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content or delta.tool_calls:
+                    span.first_token()
+
+                if delta.content:
+                    print(delta.content, end="", flush=True)
+                    content_parts.append(delta.content)
+
+                for tool_call_delta in delta.tool_calls or []:
+                    if tool_call_delta.index not in calls:
+                        # A new call means the earlier ones are complete
+                        start_pending_calls()
+                        calls[tool_call_delta.index] = {
+                            "id": "",
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""},
+                        }
+                    call = calls[tool_call_delta.index]
+                    if tool_call_delta.id:
+                        call["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        call["function"]["name"] += tool_call_delta.function.name or ""
+                        call["function"]["arguments"] += tool_call_delta.function.arguments or ""
+            start_pending_calls()
+        except BaseException as e:
+            for task in tasks.values():
+                task.cancel()
+            tracer.finish(span, e)
+            raise
+
+        if content_parts:
+            print()
+
+        ordered = sorted(calls)
+        message = {
+            "role": "assistant",
+            "content": "".join(content_parts) or None,
+        }
+        if ordered:
+            message["tool_calls"] = [calls[index] for index in ordered]
+        span.set(response_bytes=payload_bytes(message), tool_calls=len(ordered))
+        tracer.finish(span)
+        return message, [(calls[index], tasks[index]) for index in ordered]
+
     async def process_query(self, query):
         messages = [
             {'role':'user',
@@ -59,67 +165,119 @@ class MCP_ChatBot:
 
         has_tool_use = True
         while has_tool_use:
-            response = self.openai_client.chat.completions.create(
-                model=free_model,
-                messages=messages, # type: ignore
-                tools=self.available_tools, # type: ignore
-            )
+            # Condense or drop older rounds so the request size stays bounded
+            self.context_budget.compact(messages)
+            message, tool_calls = await self.stream_completion(messages)
             
-            print(f"[DEBUG] First response: {response}")
+            debug(f"[DEBUG] Assistant message: {message}")
 
-            message = response.choices[0].message
             messages.append(message)
 
-            if message.tool_calls:
+            if tool_calls:
                 has_tool_use = True
-                tool_calls = message.tool_calls
-                print(f"[DEBUG] Tool calls: {tool_calls}")
-
-                for tool_call in tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = tool_call.function.arguments
-                    print(f"[DEBUG] Calling tool {tool_name} with args {tool_args}")
 
-                    # session = self.tool_to_session[tool_name]
-                    session = self.sessions[tool_name]
-                    result = await session.call_tool(tool_name,arguments=json.loads(tool_args)) # type: ignore
-                    print(f"[DEBUG] Tool result: {result}")
+                # The calls were started while streaming; collect the results
+                # in tool_call order
+                results = await asyncio.gather(*(task for _, task in tool_calls))
 
+                for (tool_call, _), content in zip(tool_calls, results):
                     messages.append({
-                        'tool_call_id': tool_call.id,
+                        'tool_call_id': tool_call["id"],
                         'role': 'tool',
-                        'name': tool_name,
-                        'content': result.content
+                        'name': tool_call["function"]["name"],
+                        'content': self.context_budget.tool_result(content)
                     })
-                
-                # print(f"[DEBUG] Messages before second call: {messages}")
-                # response = self.openai_client.chat.completions.create(
-                #     model=free_model,
-                #     messages=messages
-                # )
-                # print(f"[DEBUG] Second response: {response}")
-                
-                # print(response.choices[0].message.content)
             else:
                 has_tool_use = False
-                print(response.choices[0].message.content)
+
+    async def call_tool(self, tool_name: str, arguments: dict):
+        """
+        Call a tool on its server, limiting how many calls each server runs
+        at once and reusing cached results of idempotent tools. A lazy server
+        is started by its first call.
+        """
+        # session = self.tool_to_session[tool_name]
+        server = self.sessions[tool_name]
+        with tracer.span("call_tool", tool_name, request_bytes=payload_bytes(arguments)) as span:
+            cached = self.tool_cache.get_tool(server, tool_name, arguments)
+            if cached is not None:
+                debug(f"[DEBUG] [cache hit] {tool_name} {arguments}")
+                span.set(cached=True, response_bytes=payload_bytes(cached))
+                return cached
+
+            limit = self.session_limits.get(server)
+            if limit is None:
+                limit = self.session_limits[server] = asyncio.Semaphore(SESSION_CONCURRENCY)
+            # A mutating call that finishes while this one runs moves the epoch on
+            epoch = self.tool_cache.epoch(server)
+            try:
+                async with limit, server.use() as session:
+                    result = await session.call_tool(tool_name, arguments=arguments) # type: ignore
+            finally:
+                # A mutating tool may have changed what cached results would return
+                if tool_name in self.tool_cache.mutating_tools:
+                    self.tool_cache.invalidate(server)
+            self.tool_cache.put_tool(server, tool_name, arguments, result, epoch)
+            span.set(cached=False, response_bytes=payload_bytes(result), is_error=bool(result.isError))
+            return result
+
+    async def fetch_page(self, arguments: dict) -> str:
+        """Call the fetch tool once and return its text, raising if it reports an error."""
+        result = await self.call_tool('fetch', arguments)
+        text = "\n".join(item.text for item in result.content if hasattr(item, 'text'))
+        if result.isError:
+            raise RuntimeError(text)
+        return text
+
+    async def run_tool_call(self, tool_name: str, tool_args: str):
+        """Run one tool call from the model and return the content for its tool message."""
+        debug(f"[DEBUG] Calling tool {tool_name} with args {tool_args}")
+        try:
+            arguments = json.loads(tool_args or "{}")
+            if tool_name == 'fetch':
+                # Long pages come back in pieces; assemble them, but no more
+                # than the tool result budget would keep anyway (less room
+                # for the header and the truncation note)
+                budget_chars = self.context_budget.max_tool_result_tokens * CHARS_PER_TOKEN - 1000
+                max_chars = min(FETCH_MAX_CHARS, max(budget_chars, 1000))
+                text = await fetch_all_pages(self.fetch_page, arguments, max_chars, FETCH_CONCURRENCY)
+                debug(f"[DEBUG] Tool result: {len(text)} characters")
+                return text
+            result = await self.call_tool(tool_name, arguments)
+        except Exception as e:
+            # Report the failure to the model instead of dropping the other results
+            print(f"Tool {tool_name} failed: {e}")
+            return f"Error calling tool {tool_name}: {e}"
+        debug(f"[DEBUG] Tool result: {result}")
+        return "\n".join(item.text if hasattr(item, 'text') else str(item) for item in result.content)
 
     async def get_resource(self, resource_uri):
-        session = self.sessions.get(resource_uri)
+        server = self.sessions.get(resource_uri)
 
         # Fallback for papers URIs - try any papers resource session, the topic user gave may not exists.
-        if not session and resource_uri.startswith("papers://"):
-            for uri, sess in self.sessions.items():
+        if not server and resource_uri.startswith("papers://"):
+            for uri, srv in self.sessions.items():
                 if uri.startswith("papers://"):
-                    session = sess
+                    server = srv
                     break
             
-        if not session:
+        if not server:
             print(f"Resource '{resource_uri}' not found.")
             return
         
         try:
-            result = await session.read_resource(uri = resource_uri)
+            # Spans are grouped by scheme; the full URI is kept as an attribute
+            with tracer.span("read_resource", resource_uri.split("://")[0] + "://", uri=resource_uri) as span:
+                result = self.tool_cache.get_resource(server, resource_uri)
+                if result is not None:
+                    debug(f"[DEBUG] [cache hit] {resource_uri}")
+                    span.set(cached=True)
+                else:
+                    async with server.use() as session:
+                        result = await session.read_resource(uri = resource_uri)
+                    self.tool_cache.put_resource(server, resource_uri, result)
+                    span.set(cached=False)
+                span.set(response_bytes=payload_bytes(result))
             if result and result.contents:
                 print(f"\nResource: {resource_uri}")
                 print("Content:")
@@ -148,13 +306,14 @@ class MCP_ChatBot:
 
     async def execute_prompts(self, prompt_name, args):
         """Execute a prompt with the given arguments."""        
-        session = self.sessions.get(prompt_name)
-        if not session:
+        server = self.sessions.get(prompt_name)
+        if not server:
             print(f"Prompt '{prompt_name}' not found.")
             return
         
         try:
-            result = await session.get_prompt(prompt_name, arguments=args)
+            async with server.use() as session:
+                result = await session.get_prompt(prompt_name, arguments=args)
             if result and result.messages:
                 prompt_content = result.messages[0].content
                 
@@ -169,7 +328,7 @@ class MCP_ChatBot:
                                   for item in prompt_content)
                 
                 print(f"\nExecuting prompt '{prompt_name}'...")
-                print(f"    [Debug] text sent to query: {text}")
+                debug(f"    [Debug] text sent to query: {text}")
                 await self.process_query(text)
         except Exception as e:
             print(f"Error {e}")
@@ -221,79 +380,162 @@ class MCP_ChatBot:
                 print(f"\nError: {e}")
                 traceback.print_exc()
 
-    async def connect_to_server(self, server_name: str, server_config: dict) -> None:
-        """Connect to a single MCP server."""
-        try:
-            server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
-            ) # new 
-
-            await session.initialize()
-            self.session_list.append(session)
-
-            # List available tools for this session
-            response = await session.list_tools()
-            tools = response.tools
-            print(f"\nConnected to {server_name} with tools:", [t.name for t in tools])
-            
-            for tool in tools: # new
-                # self.tool_to_session[tool.name] = session
-                self.sessions[tool.name] = session
-                self.available_tools.append({
+    async def discover_server(self, session: ClientSession, server_name: str = "") -> Dict:
+        """
+        Initialize a session and list its tools, resources and prompts concurrently.
+
+        Returns:
+            JSON-serializable capabilities: version, tools (in OpenAI function
+            format), resources (URIs) and prompts
+        """
+        init_result = await traced("initialize", server_name, session.initialize())
+
+        # Servers without resources or prompts answer those calls with an error
+        tools_response, resource_response, prompts_response = await asyncio.gather(
+            traced("list_tools", server_name, session.list_tools()),
+            traced("list_resources", server_name, session.list_resources()),
+            traced("list_prompts", server_name, session.list_prompts()),
+            return_exceptions=True,
+        )
+        if isinstance(tools_response, BaseException):
+            raise tools_response
+        resources = [] if isinstance(resource_response, BaseException) else resource_response.resources
+        prompts = [] if isinstance(prompts_response, BaseException) else prompts_response.prompts
+
+        return {
+            "version": init_result.serverInfo.version,
+            "tools": [
+                {
                     "type": "function",
                     "function": {
                         "name": tool.name,
                         "description": tool.description if tool.description else "",
                         "parameters": tool.inputSchema
                     }
-                })
+                }
+                for tool in tools_response.tools
+            ],
+            "resources": [str(res.uri) for res in resources],
+            "prompts": [
+                {
+                    "name": prompt.name,
+                    "description": prompt.description,
+                    "arguments": [arg.model_dump() for arg in prompt.arguments or []]
+                }
+                for prompt in prompts
+            ],
+        }
+
+    def rebuild_registry(self) -> None:
+        """Recompute the tool, resource and prompt maps from every usable server, in config order."""
+        self.sessions = {}
+        self.available_tools = []
+        self.available_prompts = []
+
+        for server_name, server in self.servers.items():
+            if server_name not in self.server_capabilities:
+                continue
+            capabilities = self.server_capabilities[server_name]
+
+            for tool in capabilities["tools"]: # new
+                # self.tool_to_session[tool.name] = session
+                self.sessions[tool["function"]["name"]] = server
+                self.available_tools.append(tool)
 
             # List avaialbe resources
-            resource_response = await session.list_resources()
-            if resource_response and resource_response.resources:
-                for res in resource_response.resources:
-                    resource_uri = str(res.uri)
-                    self.sessions[resource_uri] = session
+            for resource_uri in capabilities["resources"]:
+                self.sessions[resource_uri] = server
 
             # List avaialbe prompts
-            prompts_response = await session.list_prompts()
-            if prompts_response and prompts_response.prompts:
-                for prompt in prompts_response.prompts:
-                    self.sessions[prompt.name] = session
-                    self.available_prompts.append(
-                        {
-                            "name": prompt.name,
-                            "description": prompt.description,
-                            "arguments": prompt.arguments
-                        }
-                    )
-            
-
-        except Exception as e:
-            print(f"Failed to connect to {server_name}: {e}")
-            traceback.print_exc()
+            for prompt in capabilities["prompts"]:
+                self.sessions[prompt["name"]] = server
+                self.available_prompts.append(prompt)
+
+    def server_discovered(self, server: ServerProcess, capabilities: Dict) -> None:
+        """Record the capabilities a server reported when it (re)started."""
+        print(f"\nConnected to {server.name} in {server.startup_seconds:.2f}s with tools:", [t["function"]["name"] for t in capabilities["tools"]])
+        self.snapshots.save(server.config, capabilities)
+        previous = self.server_capabilities.get(server.name)
+        self.server_capabilities[server.name] = capabilities
+        if previous is not None and previous != capabilities:
+            print(f"\n{server.name} capabilities changed since the last run; updated")
+            self.rebuild_registry()
+
+    async def revalidate_server(self, server: ServerProcess) -> None:
+        """Finish a warm-started server's handshake, dropping it if it fails."""
+        if await server.start() is None:
+            print(f"\n{server.name} failed to start; its tools are no longer available")
+            self.server_capabilities.pop(server.name, None)
+            self.rebuild_registry()
 
     async def connect_to_servers(self): # new
-        """Connect to all configured MCP servers."""
+        """
+        Connect to all configured MCP servers concurrently.
+
+        Each server may set "timeout" (seconds) in server_config.json; the
+        default comes from MCP_SERVER_TIMEOUT. A server that fails or times
+        out is skipped without holding up the others.
+
+        Servers with a capability snapshot from an earlier run are usable
+        immediately; their handshake finishes and is checked against the
+        snapshot in the background.
+
+        Lazy servers ("lazy": true, or MCP_LAZY_SERVERS=1 for all) with a
+        snapshot aren't started until one of their tools, resources or
+        prompts is used, and are stopped again after "idleTimeout" seconds
+        without use (default MCP_IDLE_TIMEOUT).
+        """
         try:
             with open("server_config.json", "r") as file:
                 data = json.load(file)
             
             servers = data.get("mcpServers", {})
-            
-            for server_name, server_config in servers.items():
-                await self.connect_to_server(server_name, server_config)
+            self.tool_cache = ToolResultCache.from_config(data.get("toolCache", {}))
         except Exception as e:
             print(f"Error loading server configuration: {e}")
             raise
 
+        default_timeout = float(os.environ.get("MCP_SERVER_TIMEOUT", 30))
+        default_lazy = os.environ.get("MCP_LAZY_SERVERS", "").lower() in ("1", "true", "yes")
+        default_idle_timeout = float(os.environ.get("MCP_IDLE_TIMEOUT", 300))
+
+        cold = []
+        for server_name, server_config in servers.items():
+            lazy = server_config.get("lazy", default_lazy)
+            server = ServerProcess(
+                server_name,
+                server_config,
+                self.discover_server,
+                timeout=server_config.get("timeout", default_timeout),
+                idle_timeout=server_config.get("idleTimeout", default_idle_timeout) if lazy else None,
+                on_discovered=self.server_discovered,
+            )
+            self.servers[server_name] = server
+
+            # Servers seen on an earlier run start from their snapshot
+            snapshot = self.snapshots.load(server_config)
+            if snapshot is None:
+                cold.append(server)
+                continue
+            self.server_capabilities[server_name] = snapshot
+            if lazy:
+                print(f"\n{server_name} will start on first use; tools from snapshot:", [t["function"]["name"] for t in snapshot["tools"]])
+            else:
+                print(f"\nLoaded {server_name} from snapshot with tools:", [t["function"]["name"] for t in snapshot["tools"]])
+                self.background_tasks.append(asyncio.create_task(self.revalidate_server(server)))
+
+        # The rest have to be started to learn what they offer; their
+        # handshakes overlap, so the wait is as long as the slowest one
+        await asyncio.gather(*(server.start() for server in cold))
+
+        # Register in config order so the tool list sent to the model is stable
+        self.rebuild_registry()
+
     async def cleanup(self):
-        await self.exit_stack.aclose()
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*(server.stop() for server in self.servers.values()))
+        tracer.write_metrics()
 
 
 
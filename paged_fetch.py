@@ -0,0 +1,103 @@
+import asyncio
+import re
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# How the fetch server (mcp-server-fetch) marks a page that has more after it.
+# Only the two newlines it adds are stripped: whitespace before them belongs
+# to the page.
+TRUNCATED_PATTERN = re.compile(
+    r"\n\n<error>Content truncated\. Call the fetch tool with a start_index of (\d+) to get more content\.</error>\s*$"
+)
+NO_MORE_CONTENT = "<error>No more content available.</error>"
+
+
+def truncated_note(next_start: int) -> str:
+    """The marker the fetch server appends to a page, so the model knows how to continue."""
+    return (
+        f"\n\n<error>Content truncated. Call the fetch tool with a start_index of {next_start}"
+        " to get more content.</error>"
+    )
+
+
+def split_page(text: str) -> Tuple[str, str, Optional[int]]:
+    """
+    Split one page returned by the fetch tool.
+
+    Returns:
+        The header ("Contents of <url>:" and any notice before it), the page
+        body, and the start_index of the next page (None on the last page)
+    """
+    header = ""
+    marker = text.find("Contents of ")
+    if marker != -1:
+        end = text.find("\n", marker)
+        if end != -1:
+            header, text = text[:end + 1], text[end + 1:]
+
+    match = TRUNCATED_PATTERN.search(text)
+    if match is None:
+        return header, text, None
+    return header, text[:match.start()], int(match.group(1))
+
+
+async def fetch_all_pages(fetch_page: Callable[[Dict], Awaitable[str]], arguments: Dict,
+                          max_chars: int, concurrency: int = 4) -> str:
+    """
+    Call the fetch tool until a page is complete or max_chars have been read.
+
+    After the first page shows how long a page is, the following pages are
+    requested up to `concurrency` at a time. They are joined under a single
+    header. If the cap is hit (or a page fails) the result ends with the
+    fetch server's usual truncation marker, so the model can ask for more.
+
+    Args:
+        fetch_page: Calls the fetch tool with the given arguments and returns its text
+        arguments: The arguments the model passed to fetch
+        max_chars: Most characters of content to assemble
+        concurrency: Most pages requested at once
+
+    Returns:
+        The assembled text, in the same format as a single fetch result
+    """
+    first = await fetch_page(arguments)
+    header, body, next_start = split_page(first)
+    if next_start is None:
+        return first
+
+    start = int(arguments.get("start_index", 0))
+    page_chars = next_start - start
+    if page_chars <= 0:
+        return first
+    end = start + max_chars
+
+    bodies = [body]
+    failed = False
+    while next_start is not None and next_start < end and not failed:
+        # Pages before the last one are always full, so their offsets are known
+        starts = list(range(next_start, end, page_chars))[:concurrency]
+        pages = await asyncio.gather(
+            *(fetch_page({**arguments, "start_index": s, "max_length": page_chars}) for s in starts),
+            return_exceptions=True,
+        )
+        for page_start, page in zip(starts, pages):
+            if isinstance(page, BaseException):
+                # Stop here and let the model retry from this page
+                print(f"Fetching the page at start_index {page_start} failed: {page}")
+                next_start = page_start
+                failed = True
+                break
+            _, body, next_start = split_page(page)
+            if body.strip() == NO_MORE_CONTENT:
+                next_start = None
+            else:
+                bodies.append(body)
+            if next_start is None:
+                break
+
+    content = "".join(bodies)
+    if len(content) > max_chars:
+        content = content[:max_chars]
+        next_start = end
+    if next_start is not None:
+        content += truncated_note(next_start)
+    return header + content
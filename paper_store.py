@@ -0,0 +1,776 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; writers are then only serialized within a process
+    fcntl = None
+
+
+# Orderings supported by list_topic_stats
+TOPIC_SORTS = ("name", "updated", "papers", "published")
+
+
+def topic_dir_name(topic: str) -> str:
+    """Normalize a topic into the folder/key name used by every backend."""
+    return topic.lower().replace(" ", "_")
+
+
+def _newest_published(papers: Dict[str, dict]) -> Optional[str]:
+    """Return the latest publication date among papers, or None."""
+    return max((info['published'] for info in papers.values() if info.get('published')), default=None)
+
+
+class PaperStore:
+    """
+    Storage interface used by research_server.
+
+    Papers are dicts with title, authors, summary, pdf_url and published keys,
+    stored once per paper_id and linked to one or more topics.
+    """
+
+    # Name of the backend, as given in PAPER_STORE
+    backend = ""
+
+    def add_papers(self, topic: str, papers: Dict[str, dict]) -> str:
+        """
+        Store papers under a topic, merging with what is already there. With
+        no papers, nothing is stored, so a search that found nothing doesn't
+        leave an empty topic behind.
+
+        Returns:
+            A human readable description of where the papers were saved
+        """
+        raise NotImplementedError
+
+    def get_paper(self, paper_id: str) -> Optional[dict]:
+        """Return the stored info for a paper, or None if it is unknown."""
+        raise NotImplementedError
+
+    def list_topics(self) -> List[str]:
+        """Return the names of all topics that have stored papers."""
+        raise NotImplementedError
+
+    def has_topic(self, topic: str) -> bool:
+        """Whether any papers are stored under topic."""
+        return self.get_topic_page(topic, 0, 1) is not None
+
+    def list_topic_stats(self, sort: str = "name", limit: Optional[int] = None) -> List[dict]:
+        """
+        Return per-topic stats from the topic manifest.
+
+        Args:
+            sort: One of TOPIC_SORTS; "updated", "papers" and "published" list
+                the largest value first
+            limit: Maximum number of topics to return
+
+        Returns:
+            Dicts with topic, paper_count, updated_at (epoch seconds) and
+            newest_published
+        """
+        raise NotImplementedError
+
+    def get_topic_papers(self, topic: str) -> Optional[Dict[str, dict]]:
+        """Return {paper_id: info} for a topic, or None if the topic is unknown."""
+        raise NotImplementedError
+
+    def generation(self, topic: Optional[str] = None) -> Hashable:
+        """
+        Return a cheap token that changes whenever stored papers change.
+
+        Args:
+            topic: Only track changes to this topic; None tracks the topic list
+        """
+        raise NotImplementedError
+
+    def get_topic_page(self, topic: str, offset: int, limit: int) -> Optional[Tuple[int, Dict[str, dict]]]:
+        """
+        Return one page of a topic's papers, in the order they were stored.
+
+        Returns:
+            (total paper count, {paper_id: info} for the page), or None if the topic is unknown
+        """
+        papers_info = self.get_topic_papers(topic)
+        if papers_info is None:
+            return None
+        page_ids = list(papers_info)[offset:offset + limit]
+        return len(papers_info), {paper_id: papers_info[paper_id] for paper_id in page_ids}
+
+
+def _write_json_atomic(path: str, data, indent: Optional[int] = None) -> None:
+    """Write JSON to a temp file and rename it over path, so readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as json_file:
+        json.dump(data, json_file, indent=indent)
+    os.replace(tmp_path, path)
+
+
+def _append_log(path: str, records: List[dict]) -> None:
+    """Append records to a JSON-lines log in a single write."""
+    lines = "".join(json.dumps(record) + "\n" for record in records).encode()
+    with open(path, "ab+") as log_file:
+        # Terminate a record cut short by a crash so it can't swallow ours
+        if log_file.tell() > 0:
+            log_file.seek(-1, os.SEEK_END)
+            if log_file.read(1) != b"\n":
+                lines = b"\n" + lines
+        log_file.write(lines)
+
+
+def _read_log(path: str, offset: int = 0) -> Tuple[List[dict], int]:
+    """
+    Read complete records from a JSON-lines log, starting at a byte offset.
+
+    A trailing line without a newline (a write cut short by a crash) is
+    ignored, so readers always see whole records.
+
+    Returns:
+        The records read and the offset just past the last complete record
+    """
+    records = []
+    try:
+        with open(path, "rb") as log_file:
+            log_file.seek(offset)
+            for line in log_file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"Skipping corrupted record in {path}")
+                offset += len(line)
+    except FileNotFoundError:
+        pass
+    return records, offset
+
+
+def _sort_topic_stats(stats: List[dict], sort: str, limit: Optional[int]) -> List[dict]:
+    """Order and trim topic stats in memory."""
+    if sort not in TOPIC_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    stats.sort(key=lambda entry: entry["topic"])
+    if sort != "name":
+        # Stable sort: ties stay in name order, missing values go last
+        field = {"updated": "updated_at", "papers": "paper_count", "published": "newest_published"}[sort]
+        stats.sort(key=lambda entry: (entry[field] is not None, entry[field] or 0), reverse=True)
+    return stats[:limit] if limit is not None else stats
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class JsonPaperStore(PaperStore):
+    """
+    Per-topic JSON files plus a global index of papers and topics.
+
+    Each topic keeps a compacted papers_info.json snapshot and an append-only
+    papers_log.jsonl of newer records, so adding papers costs time
+    proportional to the new records. The log is folded into the snapshot
+    (written with an atomic rename) once it outgrows it. The index, which
+    maps paper_id -> topics and doubles as the topic manifest, is stored the
+    same way.
+
+    Writers take an exclusive lock on papers/.write.lock (flock) as well as
+    a thread lock, so several server processes can share one papers
+    directory without losing records. Readers don't lock; they retry a read
+    that raced with a compaction.
+    """
+
+    backend = "json"
+
+    # Bumped when the index layout changes; older indexes are rebuilt
+    INDEX_VERSION = 2
+
+    SNAPSHOT_FILE = "papers_info.json"
+    LOG_FILE = "papers_log.jsonl"
+    # Logs smaller than this are never compacted
+    COMPACT_MIN_BYTES = 64 * 1024
+    LOCK_FILE = ".write.lock"
+    # Attempts at reading a topic consistently while it is being compacted
+    READ_ATTEMPTS = 3
+
+    def __init__(self, paper_dir: str) -> None:
+        self.paper_dir = paper_dir
+        self.index_file = os.path.join(paper_dir, "paper_index.json")
+        self.index_log = os.path.join(paper_dir, "paper_index.jsonl")
+        # In-memory copy of the paper index, plus how much of the snapshot
+        # and log it reflects
+        self._index_cache = {"mtime": None, "offset": 0, "index": None, "dir_mtime": None, "checked": None}
+        # Serializes read-modify-write of topic files and the index between
+        # worker threads; _exclusive() adds the cross-process file lock.
+        # Reentrant because writers can end up rebuilding the index.
+        self._write_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Hold the write lock against other threads and other processes."""
+        with self._write_lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                os.makedirs(self.paper_dir, exist_ok=True)
+                self._lock_file = open(os.path.join(self.paper_dir, self.LOCK_FILE), "a")
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _topic_file(self, topic_dir: str) -> str:
+        return os.path.join(self.paper_dir, topic_dir, self.SNAPSHOT_FILE)
+
+    def _topic_log(self, topic_dir: str) -> str:
+        return os.path.join(self.paper_dir, topic_dir, self.LOG_FILE)
+
+    def _topic_signature(self, topic_dir: str) -> Optional[list]:
+        """Return [snapshot mtime, log size] for a topic, or None if it has no papers."""
+        snapshot, log = self._topic_file(topic_dir), self._topic_log(topic_dir)
+        if not os.path.isfile(snapshot) and not os.path.isfile(log):
+            return None
+        mtime = os.path.getmtime(snapshot) if os.path.isfile(snapshot) else 0
+        return [mtime, _file_size(log)]
+
+    def _topic_signatures(self) -> dict:
+        """Return the signature of every topic folder."""
+        signatures = {}
+        if os.path.exists(self.paper_dir):
+            for item in os.listdir(self.paper_dir):
+                signature = self._topic_signature(item)
+                if signature is not None:
+                    signatures[item] = signature
+        return signatures
+
+    def _read_topic(self, topic_dir: str) -> Dict[str, dict]:
+        """
+        Return the merged snapshot + log view of a topic.
+
+        If another process compacts the topic mid-read (the snapshot is
+        replaced and the log removed), the read is repeated.
+
+        Raises json.JSONDecodeError if the snapshot is corrupted.
+        """
+        for _ in range(self.READ_ATTEMPTS - 1):
+            signature = self._topic_signature(topic_dir)
+            papers_info = self._read_topic_once(topic_dir)
+            if self._topic_signature(topic_dir) == signature:
+                return papers_info
+        with self._exclusive():
+            return self._read_topic_once(topic_dir)
+
+    def _read_topic_once(self, topic_dir: str) -> Dict[str, dict]:
+        try:
+            with open(self._topic_file(topic_dir), "r") as json_file:
+                papers_info = json.load(json_file)
+        except FileNotFoundError:
+            papers_info = {}
+
+        records, _ = _read_log(self._topic_log(topic_dir))
+        for record in records:
+            papers_info[record["id"]] = record["info"]
+        return papers_info
+
+    def _read_topic_safe(self, topic_dir: str) -> Optional[Dict[str, dict]]:
+        try:
+            return self._read_topic(topic_dir)
+        except json.JSONDecodeError as e:
+            print(f"Error reading {self._topic_file(topic_dir)}: {str(e)}")
+            return None
+
+    def compact_topic(self, topic_dir: str) -> None:
+        """Fold a topic's log into its snapshot and remove the log."""
+        with self._exclusive():
+            papers_info = self._read_topic_once(topic_dir)
+            _write_json_atomic(self._topic_file(topic_dir), papers_info, indent=2)
+            try:
+                os.remove(self._topic_log(topic_dir))
+            except FileNotFoundError:
+                pass
+
+    def _save_index(self, index: dict) -> None:
+        """Write a compacted index snapshot, drop its log and refresh the in-memory copy."""
+        with self._exclusive():
+            os.makedirs(self.paper_dir, exist_ok=True)
+            tmp_path = f"{self.index_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as json_file:
+                json.dump(index, json_file)
+            # Drop the log before the snapshot changes: a reader that sees the
+            # new snapshot must not find the old log at its remembered offset
+            try:
+                os.remove(self.index_log)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, self.index_file)
+            stat = os.stat(self.index_file)
+            self._index_cache["mtime"] = (stat.st_ino, stat.st_mtime_ns)
+            self._index_cache["offset"] = 0
+            self._index_cache["index"] = index
+
+    def _topic_updated_at(self, topic_dir: str) -> float:
+        paths = [self._topic_file(topic_dir), self._topic_log(topic_dir)]
+        return max(os.path.getmtime(path) for path in paths if os.path.isfile(path))
+
+    def rebuild_index(self) -> dict:
+        """
+        Rebuild the index by scanning every topic directory.
+
+        Returns:
+            The index: {"papers": {paper_id: [topic_dir, ...]},
+                        "topics": {topic_dir: {signature, paper_count, updated_at, newest_published}}}
+        """
+        # Holding the lock keeps other writers from appending index records
+        # that the rebuilt snapshot would then drop
+        with self._exclusive():
+            index = {"version": self.INDEX_VERSION, "papers": {}, "topics": {}}
+            for topic_dir, signature in self._topic_signatures().items():
+                papers_info = self._read_topic_safe(topic_dir)
+                if papers_info is None:
+                    continue
+                for paper_id in papers_info:
+                    index["papers"].setdefault(paper_id, []).append(topic_dir)
+                index["topics"][topic_dir] = {
+                    "signature": signature,
+                    "paper_count": len(papers_info),
+                    "updated_at": self._topic_updated_at(topic_dir),
+                    "newest_published": _newest_published(papers_info),
+                }
+
+            self._save_index(index)
+            return index
+
+    @staticmethod
+    def _apply_index_records(index: dict, records: List[dict]) -> None:
+        """Apply index log records; applying a record twice has no further effect."""
+        for record in records:
+            topic_dir = record["topic"]
+            entry = index["topics"].setdefault(topic_dir, {
+                "signature": None, "paper_count": 0, "updated_at": 0, "newest_published": None,
+            })
+            for paper_id in record["papers"]:
+                topics = index["papers"].setdefault(paper_id, [])
+                if topic_dir not in topics:
+                    topics.append(topic_dir)
+                    entry["paper_count"] += 1
+            entry["signature"] = record["signature"]
+            entry["updated_at"] = max(entry["updated_at"], record["updated_at"])
+            if record["newest_published"] and (
+                entry["newest_published"] is None or record["newest_published"] > entry["newest_published"]
+            ):
+                entry["newest_published"] = record["newest_published"]
+
+    def _index_key(self) -> Optional[tuple]:
+        # Inode as well as mtime, so a compaction by another process is noticed
+        # even within one mtime tick
+        try:
+            stat = os.stat(self.index_file)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _load_index(self) -> dict:
+        """
+        Load the paper index, rebuilding it if it is missing or unreadable.
+
+        Only log records appended since the last load are read. If another
+        process compacted the index meanwhile, the log read may have started
+        in the wrong file, so the load is repeated from the new snapshot.
+        """
+        for _ in range(self.READ_ATTEMPTS - 1):
+            index = self._load_index_once()
+            if self._index_cache["mtime"] == self._index_key():
+                return index
+            self._index_cache["mtime"] = None
+        with self._exclusive():
+            return self._load_index_once()
+
+    def _load_index_once(self) -> dict:
+        mtime = self._index_key()
+        if mtime is None:
+            return self.rebuild_index()
+
+        if self._index_cache["mtime"] != mtime:
+            try:
+                with open(self.index_file, "r") as json_file:
+                    index = json.load(json_file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return self.rebuild_index()
+            if index.get("version") != self.INDEX_VERSION:
+                return self.rebuild_index()
+            self._index_cache["mtime"] = mtime
+            self._index_cache["offset"] = 0
+            self._index_cache["index"] = index
+
+        index = self._index_cache["index"]
+        if _file_size(self.index_log) > self._index_cache["offset"]:
+            records, offset = _read_log(self.index_log, self._index_cache["offset"])
+            self._apply_index_records(index, records)
+            self._index_cache["offset"] = offset
+        return index
+
+    def _read_indexed_paper(self, index: dict, paper_id: str) -> Optional[dict]:
+        """Read a paper's info from a topic the index points to, or None."""
+        for topic_dir in index["papers"].get(paper_id, []):
+            papers_info = self._read_topic_safe(topic_dir)
+            if papers_info is not None and paper_id in papers_info:
+                return papers_info[paper_id]
+        return None
+
+    def _index_is_stale(self, index: dict) -> bool:
+        """
+        Whether topic folders were changed outside of add_papers.
+
+        The folders are only re-scanned when the index or the papers
+        directory changed since the last scan found the index up to date,
+        so repeated misses for unknown IDs don't cost a scan each.
+        """
+        try:
+            dir_mtime = os.stat(self.paper_dir).st_mtime_ns
+        except OSError:
+            dir_mtime = None
+        state = (self._index_cache["mtime"], self._index_cache["offset"], dir_mtime)
+        if self._index_cache["checked"] == state:
+            return False
+        signatures = {topic_dir: entry["signature"] for topic_dir, entry in index["topics"].items()}
+        if signatures != self._topic_signatures():
+            return True
+        self._index_cache["checked"] = state
+        return False
+
+    def _load_manifest(self) -> dict:
+        """
+        Load the index for listing topics.
+
+        Topic folders are only re-scanned when the papers directory itself
+        changed, so topics added by hand still show up.
+        """
+        index = self._load_index()
+        try:
+            dir_mtime = os.stat(self.paper_dir).st_mtime_ns
+        except OSError:
+            return index
+        if self._index_cache["dir_mtime"] != dir_mtime:
+            if set(index["topics"]) != set(self._topic_signatures()):
+                index = self.rebuild_index()
+            self._index_cache["dir_mtime"] = dir_mtime
+        return index
+
+    def add_papers(self, topic: str, papers: Dict[str, dict]) -> str:
+        if not papers:
+            return self._topic_log(topic_dir_name(topic))
+        with self._exclusive():
+            return self._add_papers(topic, papers)
+
+    def _add_papers(self, topic: str, papers: Dict[str, dict]) -> str:
+        topic_dir = topic_dir_name(topic)
+        os.makedirs(os.path.join(self.paper_dir, topic_dir), exist_ok=True)
+        log_path = self._topic_log(topic_dir)
+
+        # Append only the new records; fold the log into the snapshot once it
+        # outgrows it so reads stay cheap
+        _append_log(log_path, [{"id": paper_id, "info": info} for paper_id, info in papers.items()])
+        log_size = _file_size(log_path)
+        if log_size > max(self.COMPACT_MIN_BYTES, _file_size(self._topic_file(topic_dir))):
+            try:
+                self.compact_topic(topic_dir)
+            except json.JSONDecodeError as e:
+                print(f"Not compacting {topic_dir}: {str(e)}")
+
+        # Keep the global paper index in sync with the topic
+        record = {
+            "topic": topic_dir,
+            "papers": list(papers),
+            "signature": self._topic_signature(topic_dir),
+            "updated_at": time.time(),
+            "newest_published": _newest_published(papers),
+        }
+        _append_log(self.index_log, [record])
+        # Reading our own record back also picks up any written by others
+        index = self._load_index()
+        if _file_size(self.index_log) > max(self.COMPACT_MIN_BYTES, _file_size(self.index_file)):
+            self._save_index(index)
+
+        return log_path
+
+    def get_paper(self, paper_id: str) -> Optional[dict]:
+        index = self._load_index()
+        paper_info = self._read_indexed_paper(index, paper_id)
+
+        # The index only misses when the topic folders were changed outside of
+        # add_papers, so rebuild it once before giving up.
+        if paper_info is None and self._index_is_stale(index):
+            paper_info = self._read_indexed_paper(self.rebuild_index(), paper_id)
+        return paper_info
+
+    def list_topics(self) -> List[str]:
+        return list(self._load_manifest()["topics"])
+
+    def has_topic(self, topic: str) -> bool:
+        return self._topic_signature(topic_dir_name(topic)) is not None
+
+    def list_topic_stats(self, sort: str = "name", limit: Optional[int] = None) -> List[dict]:
+        stats = [
+            {
+                "topic": topic_dir,
+                "paper_count": entry["paper_count"],
+                "updated_at": entry["updated_at"],
+                "newest_published": entry["newest_published"],
+            }
+            for topic_dir, entry in self._load_manifest()["topics"].items()
+        ]
+        return _sort_topic_stats(stats, sort, limit)
+
+    def generation(self, topic: Optional[str] = None) -> Hashable:
+        if topic is not None:
+            signature = self._topic_signature(topic_dir_name(topic))
+            return tuple(signature) if signature else None
+        # New topic folders change the directory mtime; every add_papers
+        # call appends to the index log
+        try:
+            dir_mtime = os.stat(self.paper_dir).st_mtime_ns
+            index_stat = os.stat(self.index_file)
+            index_mtime = (index_stat.st_ino, index_stat.st_mtime_ns)
+        except OSError:
+            dir_mtime = index_mtime = None
+        return (dir_mtime, index_mtime, _file_size(self.index_log))
+
+    def get_topic_papers(self, topic: str) -> Optional[Dict[str, dict]]:
+        """Raises json.JSONDecodeError if the topic snapshot is corrupted."""
+        topic_dir = topic_dir_name(topic)
+        if self._topic_signature(topic_dir) is None:
+            return None
+        return self._read_topic(topic_dir)
+
+
+class SqlitePaperStore(PaperStore):
+    """
+    Single-file SQLite store in WAL mode.
+
+    Each paper is stored once in `papers`; `topic_papers` records which topics
+    it was found under. Writes happen in a single transaction, so concurrent
+    search_papers calls can't lose each other's updates.
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS papers (
+            paper_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            authors TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            pdf_url TEXT,
+            published TEXT
+        );
+        CREATE TABLE IF NOT EXISTS topic_papers (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            paper_id TEXT NOT NULL REFERENCES papers(paper_id),
+            UNIQUE (topic, paper_id)
+        );
+        CREATE INDEX IF NOT EXISTS topic_papers_paper ON topic_papers(paper_id);
+        CREATE TABLE IF NOT EXISTS topics (
+            topic TEXT PRIMARY KEY,
+            paper_count INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            newest_published TEXT
+        );
+        CREATE TABLE IF NOT EXISTS generation (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO generation VALUES (0, 0);
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        # sqlite3 connections can't be shared across threads
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        # Databases created before the topics manifest existed
+        with conn:
+            conn.execute(
+                """INSERT OR IGNORE INTO topics
+                   SELECT t.topic, COUNT(*), ?, MAX(p.published)
+                   FROM topic_papers t JOIN papers p USING (paper_id) GROUP BY t.topic""",
+                (time.time(),),
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_info(row: sqlite3.Row) -> dict:
+        return {
+            'title': row['title'],
+            'authors': json.loads(row['authors']),
+            'summary': row['summary'],
+            'pdf_url': row['pdf_url'],
+            'published': row['published']
+        }
+
+    def add_papers(self, topic: str, papers: Dict[str, dict]) -> str:
+        topic_dir = topic_dir_name(topic)
+        if not papers:
+            return f"{self.db_path} (topic: {topic_dir})"
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (paper_id, info['title'], json.dumps(info['authors']),
+                     info['summary'], info.get('pdf_url'), info.get('published'))
+                    for paper_id, info in papers.items()
+                ],
+            )
+            added = conn.executemany(
+                "INSERT OR IGNORE INTO topic_papers (topic, paper_id) VALUES (?, ?)",
+                [(topic_dir, paper_id) for paper_id in papers],
+            ).rowcount
+            conn.execute(
+                """INSERT INTO topics VALUES (?, ?, ?, ?)
+                   ON CONFLICT (topic) DO UPDATE SET
+                       paper_count = paper_count + excluded.paper_count,
+                       updated_at = excluded.updated_at,
+                       newest_published = NULLIF(MAX(COALESCE(newest_published, ''),
+                                                     COALESCE(excluded.newest_published, '')), '')""",
+                (topic_dir, added, time.time(), _newest_published(papers)),
+            )
+            conn.execute("UPDATE generation SET value = value + 1")
+        return f"{self.db_path} (topic: {topic_dir})"
+
+    def get_paper(self, paper_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT * FROM papers WHERE paper_id = ?", (paper_id,)
+        ).fetchone()
+        return self._row_to_info(row) if row else None
+
+    def list_topics(self) -> List[str]:
+        rows = self._connect().execute("SELECT topic FROM topics ORDER BY rowid").fetchall()
+        return [row['topic'] for row in rows]
+
+    def has_topic(self, topic: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM topics WHERE topic = ?", (topic_dir_name(topic),)
+        ).fetchone()
+        return row is not None
+
+    def list_topic_stats(self, sort: str = "name", limit: Optional[int] = None) -> List[dict]:
+        if sort not in TOPIC_SORTS:
+            raise ValueError(f"Unknown sort: {sort}")
+        order_by = {
+            "name": "topic",
+            "updated": "updated_at DESC, topic",
+            "papers": "paper_count DESC, topic",
+            "published": "newest_published IS NULL, newest_published DESC, topic",
+        }[sort]
+        rows = self._connect().execute(
+            f"SELECT * FROM topics ORDER BY {order_by} LIMIT ?",
+            (limit if limit is not None else -1,),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_topic_papers(self, topic: str) -> Optional[Dict[str, dict]]:
+        rows = self._connect().execute(
+            """SELECT p.* FROM topic_papers t JOIN papers p USING (paper_id)
+               WHERE t.topic = ? ORDER BY t.seq""",
+            (topic_dir_name(topic),),
+        ).fetchall()
+        if not rows:
+            return None
+        return {row['paper_id']: self._row_to_info(row) for row in rows}
+
+    def generation(self, topic: Optional[str] = None) -> Hashable:
+        # A single counter bumped by every write, visible to all processes
+        return self._connect().execute("SELECT value FROM generation").fetchone()[0]
+
+    def get_topic_page(self, topic: str, offset: int, limit: int) -> Optional[Tuple[int, Dict[str, dict]]]:
+        conn = self._connect()
+        topic_dir = topic_dir_name(topic)
+        total = conn.execute(
+            "SELECT COUNT(*) FROM topic_papers WHERE topic = ?", (topic_dir,)
+        ).fetchone()[0]
+        if not total:
+            return None
+        rows = conn.execute(
+            """SELECT p.* FROM topic_papers t JOIN papers p USING (paper_id)
+               WHERE t.topic = ? ORDER BY t.seq LIMIT ? OFFSET ?""",
+            (topic_dir, limit, offset),
+        ).fetchall()
+        return total, {row['paper_id']: self._row_to_info(row) for row in rows}
+
+
+def get_store(paper_dir: str) -> PaperStore:
+    """
+    Create the store selected by the PAPER_STORE environment variable.
+
+    PAPER_STORE=json (default) keeps the per-topic JSON files;
+    PAPER_STORE=sqlite uses PAPER_DB (default: <paper_dir>/papers.db).
+    """
+    backend = os.environ.get("PAPER_STORE", "json").lower()
+    if backend == "sqlite":
+        return SqlitePaperStore(os.environ.get("PAPER_DB", os.path.join(paper_dir, "papers.db")))
+    if backend == "json":
+        return JsonPaperStore(paper_dir)
+    raise ValueError(f"Unknown PAPER_STORE backend: {backend}")
+
+
+def migrate_json_to_sqlite(paper_dir: str, db_path: str) -> int:
+    """
+    Copy every papers/<topic>/papers_info.json into a SQLite store.
+
+    Safe to re-run: existing papers are replaced with the JSON version.
+
+    Returns:
+        Number of (topic, paper) entries migrated
+    """
+    source = JsonPaperStore(paper_dir)
+    target = SqlitePaperStore(db_path)
+    migrated = 0
+    for topic_dir in source.list_topics():
+        try:
+            papers_info = source.get_topic_papers(topic_dir)
+        except json.JSONDecodeError as e:
+            print(f"Skipping {topic_dir}: {str(e)}")
+            continue
+        if papers_info:
+            target.add_papers(topic_dir, papers_info)
+            migrated += len(papers_info)
+            print(f"Migrated {len(papers_info)} papers from {topic_dir}")
+    return migrated
+
+
+if __name__ == "__main__":
+    # Usage: python paper_store.py migrate [paper_dir] [db_path]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("Usage: python paper_store.py migrate [paper_dir] [db_path]")
+        sys.exit(1)
+    paper_dir = sys.argv[2] if len(sys.argv) > 2 else "papers"
+    db_path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(paper_dir, "papers.db")
+    count = migrate_json_to_sqlite(paper_dir, db_path)
+    print(f"Migrated {count} papers into {db_path}")
@@ -0,0 +1,450 @@
+import asyncio
+import json
+import mmap
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import anyio
+import httpx
+from pypdf import PdfReader
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; downloads are then only deduplicated within a process
+    fcntl = None
+
+
+def file_stem(paper_id: str) -> str:
+    """File name for a paper ID; old-style arXiv IDs like hep-th/9901001 contain a slash."""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", paper_id)
+
+
+# Lines taken for section headings: "3 Method", "2.1. Setup", "IV. RESULTS",
+# "Abstract", "References", "Appendix A Proofs"
+SECTION_HEADING = re.compile(
+    r"^(?:(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+[A-Z][^.!?:;,]{0,60}"
+    r"|(?i:Abstract|References|Bibliography|Acknowledge?ments?|Appendix)(?:\s+[A-Z][^.!?]{0,60})?)$"
+)
+# Longer lines are never headings
+MAX_HEADING_BYTES = 80
+
+
+def _heading_level(title: str) -> int:
+    """1 for "3 Method" or "Abstract", 2 for "3.1 Setup" and so on."""
+    match = re.match(r"\d+(?:\.\d+)*", title)
+    return match.group(0).count(".") + 1 if match else 1
+
+
+def build_section_index(text_path: str, index_path: str) -> dict:
+    """
+    Find the section headings of an extracted text and save their byte offsets.
+
+    The text is scanned line by line, never loaded whole. A section runs
+    until the next heading at the same or a higher level, so "3 Method"
+    includes "3.1 Setup". Text before the first heading is "Front matter".
+
+    Returns:
+        {"text_bytes": size, "sections": [{"title", "level", "start", "end"}]}
+    """
+    headings: List[Tuple[str, int, int]] = []
+    offset = 0
+    with open(text_path, "rb") as text_file:
+        for line in text_file:
+            stripped = line.strip()
+            if 0 < len(stripped) <= MAX_HEADING_BYTES:
+                title = stripped.decode("utf-8", "replace")
+                if SECTION_HEADING.match(title):
+                    headings.append((title, _heading_level(title), offset))
+            offset += len(line)
+
+    if not headings or headings[0][2] > 0:
+        headings.insert(0, ("Front matter", 1, 0))
+    sections = []
+    for i, (title, level, start) in enumerate(headings):
+        end = next((later[2] for later in headings[i + 1:] if later[1] <= level), offset)
+        sections.append({"title": title, "level": level, "start": start, "end": end})
+
+    index = {"text_bytes": offset, "sections": sections}
+    tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as index_file:
+        json.dump(index, index_file)
+    os.replace(tmp_path, index_path)
+    return index
+
+
+def find_section(sections: List[dict], query: str) -> Optional[dict]:
+    """
+    Pick the section a query names: its exact title, the title without its
+    number ("introduction" for "1 Introduction"), its number ("3.1"), or
+    else the first title that starts with or contains the query.
+    """
+    query = " ".join(query.lower().split())
+    if not query:
+        return None
+
+    def unnumbered(title: str) -> str:
+        return re.sub(r"^(?:\d+(?:\.\d+)*\.?|[ivx]+\.)\s+", "", title.lower())
+
+    matchers = [
+        lambda title: title.lower() == query,
+        lambda title: unnumbered(title) == query,
+        lambda title: title.split(" ")[0].rstrip(".") == query.rstrip("."),
+        lambda title: unnumbered(title).startswith(query),
+        lambda title: query in title.lower(),
+    ]
+    for matches in matchers:
+        for section in sections:
+            if matches(section["title"]):
+                return section
+    return None
+
+
+def extract_pdf_text(pdf_path: str, text_path: str) -> int:
+    """
+    Extract the text of a PDF page by page into text_path.
+
+    The text is written to a temp file and renamed into place, so a text
+    file that exists is always complete.
+
+    Returns:
+        Size of the text file in bytes
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        if pdf_file.read(5) != b"%PDF-":
+            raise ValueError("Downloaded file is not a PDF")
+
+    reader = PdfReader(pdf_path)
+    tmp_path = f"{text_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as text_file:
+            for page in reader.pages:
+                text_file.write(page.extract_text() or "")
+                text_file.write("\n\n")
+        os.replace(tmp_path, text_path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    return os.path.getsize(text_path)
+
+
+class PaperTextCache:
+    """
+    Full text of papers, downloaded from their pdf_url and extracted once,
+    with an index of the sections' byte offsets for random access.
+
+    Each paper goes through a two-stage pipeline in the background: the PDF
+    is streamed to <id>.pdf.part chunk by chunk (at most `download_workers` at a
+    time), renamed to <id>.pdf when complete, and its text extracted to
+    <id>.txt (at most `extract_workers` at a time), whose section headings
+    are indexed in <id>.sections.json. An interrupted download
+    resumes from the partial file with an HTTP Range request. A lock on the
+    partial file keeps server processes sharing the directory from
+    downloading the same paper twice.
+    """
+
+    # Attempts at finishing one download, each resuming where the last stopped
+    DOWNLOAD_ATTEMPTS = 3
+
+    def __init__(self, text_dir: str, download_workers: int = 4, extract_workers: int = 2,
+                 max_bytes: int = 100 * 1024 * 1024, timeout: float = 60) -> None:
+        """
+        Args:
+            text_dir: Directory holding PDFs and extracted text
+            download_workers: Most PDFs downloaded at once
+            extract_workers: Most PDFs having their text extracted at once
+            max_bytes: Largest PDF accepted
+            timeout: Seconds without progress before a download attempt fails
+        """
+        self.text_dir = text_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.download_limiter = anyio.CapacityLimiter(download_workers)
+        self.extract_limiter = anyio.CapacityLimiter(extract_workers)
+        # Pipelines running in this process, and why recent ones failed
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._errors: Dict[str, str] = {}
+        # Section indexes read so far: paper_id -> (text mtime, index)
+        self._section_cache: Dict[str, Tuple[int, dict]] = {}
+        self.generation_path = os.path.join(text_dir, ".generation")
+        os.makedirs(text_dir, exist_ok=True)
+
+    def pdf_path(self, paper_id: str) -> str:
+        return os.path.join(self.text_dir, file_stem(paper_id) + ".pdf")
+
+    def text_path(self, paper_id: str) -> str:
+        return os.path.join(self.text_dir, file_stem(paper_id) + ".txt")
+
+    def section_index_path(self, paper_id: str) -> str:
+        return os.path.join(self.text_dir, file_stem(paper_id) + ".sections.json")
+
+    def has_text(self, paper_id: str) -> bool:
+        return os.path.isfile(self.text_path(paper_id))
+
+    def generation(self) -> int:
+        """Changes whenever a paper's text or section index is added."""
+        try:
+            return os.path.getsize(self.generation_path)
+        except OSError:
+            return 0
+
+    def _bump_generation(self) -> None:
+        # One byte appended per committed text or index. Appends are atomic,
+        # so every process sharing the directory sees the same count, and
+        # partial downloads or temp files never move it.
+        with open(self.generation_path, "ab") as generation_file:
+            generation_file.write(b".")
+
+    def section_index(self, paper_id: str) -> Optional[dict]:
+        """
+        The section index of a paper's text, or None if it has no text yet.
+
+        Indexes are built when the text is extracted; text extracted before
+        indexing existed, or changed since, is indexed on first use.
+        """
+        try:
+            text_mtime = os.stat(self.text_path(paper_id)).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._section_cache.get(paper_id)
+        if cached is not None and cached[0] == text_mtime:
+            return cached[1]
+
+        index_path = self.section_index_path(paper_id)
+        try:
+            with open(index_path) as index_file:
+                index = json.load(index_file)
+            if index["text_bytes"] != os.path.getsize(self.text_path(paper_id)):
+                raise ValueError("stale section index")
+        except (OSError, ValueError, KeyError):
+            index = build_section_index(self.text_path(paper_id), index_path)
+            self._bump_generation()
+        self._section_cache[paper_id] = (text_mtime, index)
+        return index
+
+    def read_range(self, paper_id: str, start: int, end: int, max_bytes: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Read bytes [start, end) of a paper's text through a memory map, so
+        only those pages of the file are touched.
+
+        A range longer than max_bytes is cut at the last line break within
+        the limit. A multi-byte character cut by the range is dropped.
+
+        Returns:
+            The text and the offset where reading stopped
+        """
+        with open(self.text_path(paper_id), "rb") as text_file:
+            size = os.fstat(text_file.fileno()).st_size
+            end = min(end, size)
+            if start >= end:
+                return "", start
+            with mmap.mmap(text_file.fileno(), 0, access=mmap.ACCESS_READ) as text_map:
+                if max_bytes is not None and end - start > max_bytes:
+                    newline = text_map.rfind(b"\n", start, start + max_bytes)
+                    end = newline + 1 if newline > start else start + max_bytes
+                return text_map[start:end].decode("utf-8", "ignore"), end
+
+    def status(self, paper_id: str) -> dict:
+        """Where a paper is in the pipeline: ready, pending, failed or not_downloaded."""
+        if self.has_text(paper_id):
+            return {"status": "ready", "text_bytes": os.path.getsize(self.text_path(paper_id))}
+        if paper_id in self._tasks:
+            part_path = self.pdf_path(paper_id) + ".part"
+            downloaded = os.path.getsize(part_path) if os.path.isfile(part_path) else None
+            if downloaded is None and os.path.isfile(self.pdf_path(paper_id)):
+                return {"status": "pending", "stage": "extracting"}
+            return {"status": "pending", "stage": "downloading", "downloaded_bytes": downloaded or 0}
+        if paper_id in self._errors:
+            return {"status": "failed", "error": self._errors[paper_id]}
+        return {"status": "not_downloaded"}
+
+    def start(self, paper_id: str, pdf_url: str) -> Optional[asyncio.Task]:
+        """Start the pipeline for a paper unless its text is cached or it is already running."""
+        if self.has_text(paper_id):
+            return None
+        task = self._tasks.get(paper_id)
+        if task is None:
+            self._errors.pop(paper_id, None)
+            task = asyncio.ensure_future(self._run(paper_id, pdf_url))
+            self._tasks[paper_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(paper_id, None))
+        return task
+
+    async def fetch(self, pdf_urls: Dict[str, str], wait: float) -> Dict[str, dict]:
+        """
+        Start the pipeline for several papers and wait up to `wait` seconds.
+
+        Papers not finished by then keep going in the background.
+
+        Args:
+            pdf_urls: {paper_id: pdf_url}
+            wait: Seconds to wait for the pipelines
+
+        Returns:
+            {paper_id: status} as returned by status()
+        """
+        tasks = [task for task in (self.start(paper_id, url) for paper_id, url in pdf_urls.items()) if task]
+        if tasks and wait > 0:
+            # asyncio.wait leaves unfinished tasks running, so they outlive this request
+            await asyncio.wait(tasks, timeout=wait)
+        return {paper_id: self.status(paper_id) for paper_id in pdf_urls}
+
+    async def _run(self, paper_id: str, pdf_url: str) -> None:
+        try:
+            started = time.perf_counter()
+            if not os.path.isfile(self.pdf_path(paper_id)):
+                async with self.download_limiter:
+                    await self._download(paper_id, pdf_url)
+            if not self.has_text(paper_id):
+                async with self.extract_limiter:
+                    try:
+                        text_bytes = await anyio.to_thread.run_sync(
+                            extract_pdf_text, self.pdf_path(paper_id), self.text_path(paper_id)
+                        )
+                    except Exception:
+                        # A broken PDF would fail the same way on every retry,
+                        # so drop it and let the next request download it again
+                        self._remove_pdf(paper_id)
+                        raise
+                    self._bump_generation()
+                    index = await anyio.to_thread.run_sync(
+                        build_section_index, self.text_path(paper_id), self.section_index_path(paper_id)
+                    )
+                    self._bump_generation()
+                print(f"Extracted {text_bytes} bytes of text in {len(index['sections'])} sections "
+                      f"from {paper_id} in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            print(f"Getting the full text of {paper_id} failed: {str(e)}")
+            self._errors[paper_id] = str(e) or type(e).__name__
+
+    def _remove_pdf(self, paper_id: str) -> None:
+        pdf_path = self.pdf_path(paper_id)
+        for path in (pdf_path, pdf_path + ".part", pdf_path + ".part.validator"):
+            _remove(path)
+
+    async def _download(self, paper_id: str, pdf_url: str) -> None:
+        """Download a PDF, resuming a partial file, unless another process is already at it."""
+        part_path = self.pdf_path(paper_id) + ".part"
+        with open(part_path, "ab") as part_file:
+            await self._lock(part_file)
+            try:
+                # Another process may have finished it while we waited
+                if os.path.isfile(self.pdf_path(paper_id)):
+                    _remove(part_path)
+                    return
+                async with httpx.AsyncClient(follow_redirects=True, timeout=self.timeout) as client:
+                    for attempt in range(1, self.DOWNLOAD_ATTEMPTS + 1):
+                        try:
+                            if await self._download_once(client, pdf_url, part_path):
+                                break
+                        except httpx.TransportError as e:
+                            if attempt == self.DOWNLOAD_ATTEMPTS:
+                                raise
+                            print(f"Download of {paper_id} interrupted ({type(e).__name__}), resuming")
+                    else:
+                        raise RuntimeError(f"Download of {paper_id} did not complete")
+                os.replace(part_path, self.pdf_path(paper_id))
+                _remove(part_path + ".validator")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(part_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    async def _lock(part_file) -> None:
+        """Take the partial file's lock, polling so the event loop isn't blocked."""
+        if fcntl is None:
+            return
+        while True:
+            try:
+                fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                await asyncio.sleep(0.5)
+
+    async def _download_once(self, client: httpx.AsyncClient, pdf_url: str, part_path: str) -> bool:
+        """
+        Stream the rest of a PDF into part_path.
+
+        Returns:
+            True once the file is complete, False if it has to start over
+        """
+        offset = os.path.getsize(part_path)
+        validator_path = part_path + ".validator"
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            validator = _read_text(validator_path)
+            if validator:
+                # The server sends the whole file instead if it changed since
+                headers["If-Range"] = validator
+
+        async with client.stream("GET", pdf_url, headers=headers) as response:
+            if response.status_code == 416:
+                # Nothing left past the partial file: it is stale, start over
+                _truncate(part_path)
+                return False
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+            if content_type.startswith("text/") or content_type.endswith(("/json", "/xml")):
+                # An error or login page sent with a 200; don't resume from it
+                self._discard(part_path)
+                raise ValueError(f"Server sent {content_type} instead of a PDF")
+            if response.status_code == 206:
+                content_range = response.headers.get("Content-Range", "")
+                if not content_range.startswith(f"bytes {offset}-"):
+                    _truncate(part_path)
+                    return False
+            else:
+                offset = 0
+                validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                with open(validator_path, "w") as validator_file:
+                    validator_file.write(validator or "")
+
+            length = int(response.headers.get("Content-Length", 0))
+            if offset + length > self.max_bytes:
+                raise ValueError(f"PDF is larger than {self.max_bytes} bytes")
+            with open(part_path, "r+b") as part_file:
+                part_file.seek(offset)
+                part_file.truncate()
+                # Chunks are written as they arrive, so an interrupted
+                # response leaves everything received so far on disk
+                async for chunk in response.aiter_bytes():
+                    offset += len(chunk)
+                    if offset > self.max_bytes:
+                        raise ValueError(f"PDF is larger than {self.max_bytes} bytes")
+                    part_file.write(chunk)
+
+        with open(part_path, "rb") as part_file:
+            if part_file.read(5) != b"%PDF-":
+                self._discard(part_path)
+                raise ValueError("Downloaded file is not a PDF")
+        return True
+
+    @staticmethod
+    def _discard(part_path: str) -> None:
+        """Empty a partial file and forget its validator, so the next attempt starts over."""
+        _truncate(part_path)
+        _remove(part_path + ".validator")
+
+
+def _read_text(path: str) -> str:
+    try:
+        with open(path) as file:
+            return file.read()
+    except FileNotFoundError:
+        return ""
+
+
+def _truncate(path: str) -> None:
+    with open(path, "r+b") as file:
+        file.truncate()
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
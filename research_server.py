@@ -1,28 +1,88 @@
+import anyio
 import arxiv
 import json
 import os
-from typing import List
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote
 from mcp.server.fastmcp import FastMCP
+from local_index import LocalSearchIndex
+from paper_store import TOPIC_SORTS, get_store, topic_dir_name
+from paper_text import PaperTextCache, find_section
+from search_cache import SearchCache
 
 PAPER_DIR = "papers"
 
+# Page size limits for the papers://{topic} resource
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+# Most bytes of paper text get_paper_section returns at once
+SECTION_MAX_BYTES = 16000
+
+# Number of rendered resource bodies kept in memory
+RESOURCE_CACHE_SIZE = 256
+
 #Initialize FastMCP server
 port = int(os.environ.get("PORT", 8000))
-mcp = FastMCP("research paper",host = "0.0.0.0")
+# Worker processes serving streamable-http on the same port. With more than
+# one, sessions are stateless so any worker can answer any request.
+WORKERS = int(os.environ.get("WORKERS", 1))
+mcp = FastMCP("research paper",host = "0.0.0.0", port = port, stateless_http = WORKERS > 1)
 
-@mcp.tool()
-def search_papers(topic: str, max_results: int = 5) -> List[str]:
+# Paper storage backend, selected with PAPER_STORE=json|sqlite
+store = get_store(PAPER_DIR)
+
+# Full-text index over stored papers, used by search_local
+local_index = LocalSearchIndex(os.path.join(PAPER_DIR, "local_index.db"))
+
+# Rendered resource bodies: uri -> (store generation, body), in LRU order
+_resource_cache: "OrderedDict[str, Tuple[Hashable, str]]" = OrderedDict()
+
+# Bounded worker pool for blocking arXiv searches, so they can't starve
+# cheap calls like extract_info under the streamable-http transport
+search_limiter = anyio.CapacityLimiter(int(os.environ.get("SEARCH_WORKERS", 4)))
+
+# Cache of arXiv search results, so repeated queries skip the network
+search_cache = SearchCache(
+    os.path.join(PAPER_DIR, "search_cache.db"),
+    ttl=float(os.environ.get("SEARCH_CACHE_TTL", 86400)),
+    max_entries=int(os.environ.get("SEARCH_CACHE_SIZE", 1000)),
+)
+
+# Full text of stored papers, downloaded and extracted by download_papers
+paper_texts = PaperTextCache(
+    os.path.join(PAPER_DIR, "fulltext"),
+    download_workers=int(os.environ.get("DOWNLOAD_WORKERS", 4)),
+    extract_workers=int(os.environ.get("EXTRACT_WORKERS", 2)),
+    max_bytes=int(os.environ.get("PDF_MAX_BYTES", 100 * 1024 * 1024)),
+)
+
+def _search_cache_key(topic: str) -> str:
+    """Cache key for a search: the topic as the store names it, per backend."""
+    return f"{store.backend}:{topic_dir_name(topic)}"
+
+def _search_and_store(topic: str, max_results: int) -> List[str]:
     """
-    Search for papers on arXiv based on a topic and store their information.
-    
-    Args:
-        topic: The topic to search for
-        max_results: Maximum number of results to retrieve (default: 5)
-        
-    Returns:
-        List of paper IDs found in the search
+    Blocking part of search_papers: query arXiv and store the results.
+
+    Runs in a worker thread so the arXiv round trip and file writes don't
+    stall the event loop.
     """
-    
+    # Serve repeated queries from the cache without touching arXiv, as long
+    # as the store still has the topic (it may have been switched or cleared).
+    # That is checked first, so an entry that can't be used counts as a miss.
+    if store.has_topic(topic):
+        cached_ids = search_cache.get(_search_cache_key(topic), max_results)
+    else:
+        cached_ids = None
+        search_cache.record_miss()
+    if cached_ids is not None:
+        print(f"Results for '{topic}' served from cache")
+        return cached_ids
+
     # Use arxiv to find the papers 
     client = arxiv.Client()
 
@@ -34,22 +94,10 @@ def search_papers(topic: str, max_results: int = 5) -> List[str]:
     )
 
     papers = client.results(search)
-    
-    # Create directory for this topic
-    path = os.path.join(PAPER_DIR, topic.lower().replace(" ", "_"))
-    os.makedirs(path, exist_ok=True)
-    
-    file_path = os.path.join(path, "papers_info.json")
-
-    # Try to load existing papers info
-    try:
-        with open(file_path, "r") as json_file:
-            papers_info = json.load(json_file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        papers_info = {}
 
     # Process each paper and add to papers_info  
     paper_ids = []
+    papers_info = {}
     for paper in papers:
         paper_ids.append(paper.get_short_id())
         paper_info = {
@@ -61,15 +109,106 @@ def search_papers(topic: str, max_results: int = 5) -> List[str]:
         }
         papers_info[paper.get_short_id()] = paper_info
     
-    # Save updated papers_info to json file
-    with open(file_path, "w") as json_file:
-        json.dump(papers_info, json_file, indent=2)
+    # Save the new papers under this topic
+    file_path = store.add_papers(topic, papers_info)
     
     print(f"Results are saved in: {file_path}")
+
+    # Make the new papers searchable offline
+    local_index.add_papers(papers_info)
+
+    search_cache.put(_search_cache_key(topic), max_results, paper_ids)
     
     return paper_ids
 
 
+@mcp.tool()
+async def search_papers(topic: str, max_results: int = 5) -> List[str]:
+    """
+    Search for papers on arXiv based on a topic and store their information.
+    
+    Args:
+        topic: The topic to search for
+        max_results: Maximum number of results to retrieve (default: 5)
+        
+    Returns:
+        List of paper IDs found in the search
+    """
+    return await anyio.to_thread.run_sync(
+        _search_and_store, topic, max_results, limiter=search_limiter
+    )
+
+
+@mcp.tool()
+async def search_papers_batch(topics: List[str], max_results: int = 5) -> Dict[str, Dict]:
+    """
+    Search arXiv for several topics at once and store each topic's papers.
+    
+    Args:
+        topics: The topics to search for
+        max_results: Maximum number of results to retrieve per topic (default: 5)
+        
+    Returns:
+        {"results": {topic: [paper IDs]}, "errors": {topic: error message}}
+    """
+    results = {}
+    errors = {}
+
+    async def run_search(topic: str) -> None:
+        try:
+            results[topic] = await anyio.to_thread.run_sync(
+                _search_and_store, topic, max_results, limiter=search_limiter
+            )
+        except Exception as e:
+            print(f"Search for '{topic}' failed: {str(e)}")
+            errors[topic] = str(e)
+
+    # The shared search_limiter bounds how many searches run at once
+    async with anyio.create_task_group() as tg:
+        for topic in dict.fromkeys(topics):
+            tg.start_soon(run_search, topic)
+
+    # Report topics in the order they were requested
+    return {
+        "results": {topic: results[topic] for topic in topics if topic in results},
+        "errors": errors,
+    }
+
+
+def _search_local(query: str, k: int) -> List[Dict]:
+    """Blocking part of search_local: backfill the index once, then rank."""
+    if not local_index.is_backfilled():
+        # Index papers that were stored before the index existed
+        for topic in store.list_topics():
+            try:
+                papers_info = store.get_topic_papers(topic)
+            except json.JSONDecodeError as e:
+                print(f"Skipping {topic}: {str(e)}")
+                continue
+            if papers_info:
+                local_index.add_papers(papers_info)
+        local_index.mark_backfilled()
+
+    return local_index.search(query, k)
+
+
+@mcp.tool()
+async def search_local(query: str, k: int = 5) -> List[Dict]:
+    """
+    Search papers already stored on disk, without contacting arXiv.
+    
+    Ranks stored papers by BM25 relevance over title, authors and summary.
+    
+    Args:
+        query: Keywords to search for
+        k: Maximum number of papers to return (default: 5)
+        
+    Returns:
+        List of matches with paper_id, title, published and score, best first
+    """
+    return await anyio.to_thread.run_sync(_search_local, query, k)
+
+
 @mcp.tool()
 def extract_info(paper_id: str) -> str:
     """
@@ -81,89 +220,282 @@ def extract_info(paper_id: str) -> str:
     Returns:
         JSON string with paper information if found, error message if not found
     """
- 
-    for item in os.listdir(PAPER_DIR):
-        item_path = os.path.join(PAPER_DIR, item)
-        if os.path.isdir(item_path):
-            file_path = os.path.join(item_path, "papers_info.json")
-            if os.path.isfile(file_path):
-                try:
-                    with open(file_path, "r") as json_file:
-                        papers_info = json.load(json_file)
-                        if paper_id in papers_info:
-                            return json.dumps(papers_info[paper_id], indent=2)
-                except (FileNotFoundError, json.JSONDecodeError) as e:
-                    print(f"Error reading {file_path}: {str(e)}")
-                    continue
+    paper_info = store.get_paper(paper_id)
+    if paper_info is not None:
+        return json.dumps(paper_info, indent=2)
     
     return f"There's no saved information related to paper {paper_id}."
 
 
+@mcp.tool()
+async def download_papers(paper_ids: List[str], wait_seconds: float = 60) -> Dict[str, Dict]:
+    """
+    Download the PDFs of stored papers and extract their full text.
+    
+    Papers must have been found with search_papers first. Downloads keep
+    running in the background after wait_seconds; call again to check on them.
+    Text that was extracted before is not downloaded again.
+    
+    Args:
+        paper_ids: The IDs of the papers to download
+        wait_seconds: How long to wait for the downloads before answering (default: 60)
+        
+    Returns:
+        {paper_id: {"status": "ready" | "pending" | "failed" | "not_found", ...}}
+    """
+    paper_ids = list(dict.fromkeys(paper_ids))
+    pdf_urls = {}
+    for paper_id in paper_ids:
+        paper_info = store.get_paper(paper_id)
+        if paper_info is not None and paper_info.get('pdf_url'):
+            pdf_urls[paper_id] = paper_info['pdf_url']
+
+    statuses = await paper_texts.fetch(pdf_urls, wait_seconds)
+    return {paper_id: statuses.get(paper_id, {"status": "not_found"}) for paper_id in paper_ids}
+
+
+def _parse_byte_range(byte_range: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse "start-end" (end exclusive, may be left out) into offsets clamped to the text."""
+    start, sep, end = byte_range.strip().partition("-")
+    try:
+        start = int(start)
+        end = int(end) if end.strip() else size
+    except ValueError:
+        return None
+    if not sep or start < 0 or end <= start:
+        return None
+    return min(start, size), min(end, size)
+
+
+@mcp.tool()
+def get_paper_section(paper_id: str, section: Optional[str] = None, byte_range: Optional[str] = None) -> str:
+    """
+    Read one section, or a byte range, of a downloaded paper's full text.
+    
+    Download the paper with download_papers first. papers://sections/{paper_id}
+    lists its sections with their byte ranges. Without section or byte_range
+    the listing is returned. Long spans are cut at SECTION_MAX_BYTES and end
+    with the byte_range to continue from.
+    
+    Args:
+        paper_id: The ID of the paper to read
+        section: Section title or number, e.g. "Introduction", "3.1" or "References"
+        byte_range: Byte offsets "start-end" into the text (end exclusive), e.g. "0-4000"
+        
+    Returns:
+        The requested text with a header giving its byte range
+    """
+    index = paper_texts.section_index(paper_id)
+    if index is None:
+        return f"There's no full text for paper {paper_id}. Download it with download_papers first."
+    if section is None and byte_range is None:
+        return _render_sections(paper_id, index)
+
+    if byte_range is not None:
+        span = _parse_byte_range(byte_range, index["text_bytes"])
+        if span is None:
+            return f"Invalid byte_range '{byte_range}'. Use \"start-end\", e.g. \"0-4000\"."
+        title = "Bytes"
+        start, end = span
+    else:
+        match = find_section(index["sections"], section)
+        if match is None:
+            titles = ", ".join(entry["title"] for entry in index["sections"])
+            return f"Paper {paper_id} has no section matching '{section}'. Sections: {titles}"
+        title, start, end = match["title"], match["start"], match["end"]
+
+    text, stop = paper_texts.read_range(paper_id, start, end, SECTION_MAX_BYTES)
+    parts = [f"# {title} ({paper_id}, bytes {start}-{stop} of {index['text_bytes']})\n\n", text]
+    if stop < end:
+        parts.append(f"\n\n[Truncated. Continue with byte_range=\"{stop}-{end}\"]")
+    return "".join(parts)
+
+
+def _render_sections(paper_id: str, index: dict) -> str:
+    parts = [f"# Sections of {paper_id}\n\nFull text: {index['text_bytes']} bytes\n\n"]
+    for entry in index["sections"]:
+        indent = "  " * (entry["level"] - 1)
+        parts.append(
+            f"{indent}- {entry['title']}: bytes {entry['start']}-{entry['end']} "
+            f"({entry['end'] - entry['start']} bytes)\n"
+        )
+    parts.append(f"\nRead one with get_paper_section(paper_id=\"{paper_id}\", section=...)\n")
+    return "".join(parts)
+
+
+def _cached_render(key: str, generation: Hashable, render: Callable[[], str]) -> str:
+    """
+    Return the cached body for key if the store hasn't changed since it was
+    rendered, otherwise render it again and cache the result.
+    """
+    cached = _resource_cache.get(key)
+    if cached is not None and generation is not None and cached[0] == generation:
+        _resource_cache.move_to_end(key)
+        return cached[1]
+
+    body = render()
+    _resource_cache[key] = (generation, body)
+    _resource_cache.move_to_end(key)
+    if len(_resource_cache) > RESOURCE_CACHE_SIZE:
+        _resource_cache.popitem(last=False)
+    return body
+
+
 @mcp.resource("papers://folders")
 def get_available_folders() ->str:
     """
     List all available topic folders in the papers directory.
     
-    This resource provides a simple list of all available topic folders.
+    This resource lists every topic with its paper count, last update and
+    newest publication date. Use papers://folders?sort=updated&limit=50 to
+    order by name, updated, papers or published and keep only the first N.
     """
-    folders = []
+    return _folders_resource({})
+
 
-    # Get all topic directories
-    if os.path.exists(PAPER_DIR):
-        for topic_dir in os.listdir(PAPER_DIR):
-            topic_path = os.path.join(PAPER_DIR, topic_dir)
-            if os.path.isdir(topic_path):
-                papers_file = os.path.join(topic_path, "papers_info.json")
-                if os.path.exists(papers_file):
-                    folders.append(topic_dir)
+def _folders_resource(params: Dict[str, str]) -> str:
+    sort = params.get("sort", "name")
+    if sort not in TOPIC_SORTS:
+        return f"# Unknown sort: {sort}\n\nUse one of: {', '.join(TOPIC_SORTS)}."
+    limit = _int_param(params, "limit", 0, 0, sys.maxsize) or None
+
+    return _cached_render(
+        f"papers://folders?sort={sort}&limit={limit}",
+        store.generation(),
+        lambda: _render_folders(sort, limit),
+    )
+
+
+def _render_folders(sort: str, limit: Optional[int]) -> str:
+    # Read per-topic stats from the store's topic manifest
+    topics = store.list_topic_stats(sort, limit)
     
     # Create a simple markdown list
-    content = "# Available Topics\n\n"
-    if folders:
-        for folder in folders:
-            content += f"- {folder}\n"
-            content += f"Use @{folder} to access papers in that topic.\n\n"
+    parts = ["# Available Topics\n\n"]
+    if topics:
+        for entry in topics:
+            updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["updated_at"]))
+            parts.append(
+                f"- {entry['topic']} ({entry['paper_count']} papers, updated {updated}, "
+                f"newest paper {entry['newest_published'] or 'unknown'})\n"
+                f"Use @{entry['topic']} to access papers in that topic.\n\n"
+            )
     else:
-        content += "No topics found.\n"
+        parts.append("No topics found.\n")
     
-    return content
+    return "".join(parts)
+
+def _parse_resource_query(value: str) -> Tuple[str, Dict[str, str]]:
+    """Split 'name?key=value&...' captured by a resource template into name and params."""
+    name, _, query = value.partition("?")
+    return unquote(name), {key: values[-1] for key, values in parse_qs(query).items()}
+
+
+def _int_param(params: Dict[str, str], key: str, default: int, minimum: int, maximum: int) -> int:
+    """Read an integer query parameter, falling back to default and clamping to range."""
+    try:
+        value = int(params.get(key, default))
+    except ValueError:
+        value = default
+    return max(minimum, min(value, maximum))
+
 
 @mcp.resource("papers://{topic}")
 def get_topic_papers(topic: str) -> str:
     """
     Get detailed information about papers on a specific topic.
     
+    Results are paginated: use papers://{topic}?page=N&size=M to pick a page
+    (default size 20, at most 200). The response includes the total count and
+    the URI of the next page.
+    
     Args:
         topic: The research topic to retrieve papers for
     """
-    topic_dir = topic.lower().replace(" ", "_")
-    papers_file = os.path.join(PAPER_DIR, topic_dir, "papers_info.json")
+    topic, params = _parse_resource_query(topic)
+    # papers://folders?sort=...&limit=... lands here because of the query string
+    if topic == "folders":
+        return _folders_resource(params)
+
+    size = _int_param(params, "size", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    page = _int_param(params, "page", 1, 1, sys.maxsize)
+
+    # Downloaded papers list their sections, so the page also changes with the full text
+    return _cached_render(
+        f"papers://{topic_dir_name(topic)}?page={page}&size={size}",
+        (store.generation(topic), paper_texts.generation()),
+        lambda: _render_topic_page(topic, page, size),
+    )
+
+
+@mcp.resource("papers://sections/{paper_id}")
+def get_paper_sections(paper_id: str) -> str:
+    """
+    List the sections of a downloaded paper's full text with their byte ranges.
     
-    if not os.path.exists(papers_file):
-        return f"# No papers found for topic: {topic}\n\nTry searching for papers on this topic first."
+    Read a section with the get_paper_section tool.
     
+    Args:
+        paper_id: The ID of the paper, downloaded with download_papers
+    """
+    paper_id = unquote(paper_id)
+    index = paper_texts.section_index(paper_id)
+    if index is None:
+        return f"# No full text for paper {paper_id}\n\nDownload it with download_papers first."
+    return _render_sections(paper_id, index)
+
+
+def _render_topic_page(topic: str, page: int, size: int) -> str:
     try:
-        with open(papers_file, 'r') as f:
-            papers_data = json.load(f)
+        topic_page = store.get_topic_page(topic, (page - 1) * size, size)
+        if topic_page is None:
+            return f"# No papers found for topic: {topic}\n\nTry searching for papers on this topic first."
+        total, papers_data = topic_page
         
-        # Create markdown content with paper details
-        content = f"# Papers on {topic.replace('_', ' ').title()}\n\n"
-        content += f"Total papers: {len(papers_data)}\n\n"
+        # Build the page in one pass and join once at the end
+        first = (page - 1) * size + 1
+        last = first + len(papers_data) - 1
+        pages = max(1, -(-total // size))
+        parts = [
+            f"# Papers on {topic.replace('_', ' ').title()}\n\n",
+            f"Total papers: {total}\n\n",
+            f"Showing {first}-{last} (page {page} of {pages})\n\n" if papers_data
+            else f"Page {page} is past the end (page {pages} is the last).\n\n",
+        ]
         
         for paper_id, paper_info in papers_data.items():
-            content += f"## {paper_info['title']}\n"
-            content += f"- **Paper ID**: {paper_id}\n"
-            content += f"- **Authors**: {', '.join(paper_info['authors'])}\n"
-            content += f"- **Published**: {paper_info['published']}\n"
-            content += f"- **PDF URL**: [{paper_info['pdf_url']}]({paper_info['pdf_url']})\n\n"
-            content += f"### Summary\n{paper_info['summary'][:500]}...\n\n"
-            content += "---\n\n"
+            parts.append(
+                f"## {paper_info['title']}\n"
+                f"- **Paper ID**: {paper_id}\n"
+                f"- **Authors**: {', '.join(paper_info['authors'])}\n"
+                f"- **Published**: {paper_info['published']}\n"
+                f"- **PDF URL**: [{paper_info['pdf_url']}]({paper_info['pdf_url']})\n"
+            )
+            index = paper_texts.section_index(paper_id)
+            if index is not None:
+                titles = ", ".join(entry["title"] for entry in index["sections"] if entry["level"] == 1)
+                parts.append(f"- **Sections**: {titles} (papers://sections/{quote(paper_id, safe='')})\n")
+            parts.append(
+                f"\n### Summary\n{paper_info['summary'][:500]}...\n\n"
+                "---\n\n"
+            )
+
+        if page < pages:
+            parts.append(f"Next page: papers://{quote(topic)}?page={page + 1}&size={size}\n")
         
-        return content
+        return "".join(parts)
     except json.JSONDecodeError:
         return f"# Error reading papers data for {topic}\n\nThe papers data file is corrupted."
 
 
+@mcp.resource("stats://search-cache")
+def get_search_cache_stats() -> str:
+    """
+    Hit, miss and eviction counters for the search_papers result cache.
+    """
+    return json.dumps(search_cache.stats(), indent=2)
+
+
 @mcp.prompt()
 def generate_search_prompt(topic: str, num_papers: int = 5) -> str:
     """Generate a prompt for Claude to find and discuss academic papers on a specific topic."""
@@ -188,7 +520,32 @@ def generate_search_prompt(topic: str, num_papers: int = 5) -> str:
     
     Please present both detailed information about each paper and a high-level synthesis of the research landscape in {topic}."""
 
+def create_http_app():
+    """ASGI app for the streamable-http transport, built in each worker process."""
+    return mcp.streamable_http_app()
+
+
+def run_http(workers: int = WORKERS, app_factory: str = "research_server:create_http_app") -> None:
+    """
+    Serve streamable-http, in `workers` processes sharing the port.
+
+    Workers share the papers directory: the stores lock or use transactions
+    for writes, and the caches check the store generation, so each worker
+    sees the others' papers.
+
+    Args:
+        workers: Number of worker processes
+        app_factory: "module:function" that each worker imports to build its app
+    """
+    if workers <= 1:
+        mcp.run(transport="streamable-http")
+        return
+    import uvicorn
+    uvicorn.run(app_factory, factory=True, host=mcp.settings.host, port=port, workers=workers,
+                log_level=mcp.settings.log_level.lower())
+
+
 if __name__ == "__main__":
     # mcp.run(transport="stdio")
     
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    run_http()
\ No newline at end of file
@@ -0,0 +1,125 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+
+def normalize_query(topic: str) -> str:
+    """Normalize a search topic so trivially different spellings share a cache entry."""
+    return " ".join(topic.lower().split())
+
+
+class SearchCache:
+    """
+    On-disk cache of arXiv search results with a TTL and LRU eviction.
+
+    Entries are keyed on the normalized key the caller passes (the research
+    server uses "<store backend>:<topic_dir_name>") and remember the
+    max_results they were fetched with, so a request for fewer results is
+    served from a larger cached result.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS search_cache (
+            query TEXT PRIMARY KEY,
+            max_results INTEGER NOT NULL,
+            paper_ids TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS search_cache_lru ON search_cache(last_used);
+    """
+
+    def __init__(self, db_path: str, ttl: float = 86400, max_entries: int = 1000) -> None:
+        """
+        Args:
+            db_path: SQLite file holding the cache
+            ttl: Seconds a cached result stays valid (0 disables the cache)
+            max_entries: Number of queries kept before the least recently used is evicted
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, topic: str, max_results: int) -> Optional[List[str]]:
+        """Return cached paper IDs for the query, or None on a miss."""
+        if self.ttl <= 0:
+            return None
+
+        query = normalize_query(topic)
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            row = conn.execute(
+                "SELECT max_results, paper_ids, created_at FROM search_cache WHERE query = ?",
+                (query,),
+            ).fetchone()
+            if row is None or row[0] < max_results:
+                self.misses += 1
+                return None
+            if now - row[2] > self.ttl:
+                conn.execute("DELETE FROM search_cache WHERE query = ?", (query,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+            conn.execute("UPDATE search_cache SET last_used = ? WHERE query = ?", (now, query))
+
+        self.hits += 1
+        return json.loads(row[1])[:max_results]
+
+    def record_miss(self) -> None:
+        """Count a lookup the caller skipped because a hit couldn't be used."""
+        if self.ttl > 0:
+            self.misses += 1
+
+    def put(self, topic: str, max_results: int, paper_ids: List[str]) -> None:
+        """Store the result of a search and evict the least recently used entries."""
+        if self.ttl <= 0:
+            return
+
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?)",
+                (normalize_query(topic), max_results, json.dumps(paper_ids), now, now),
+            )
+            evicted = conn.execute(
+                """DELETE FROM search_cache WHERE query IN (
+                       SELECT query FROM search_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,),
+            ).rowcount
+        self.evictions += evicted
+
+    def stats(self) -> dict:
+        """Return hit, miss and eviction counters plus the current cache size."""
+        size = self._connect().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
@@ -0,0 +1,147 @@
+import asyncio
+import time
+import traceback
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from tracing import tracer
+
+
+class ServerProcess:
+    """
+    One MCP server run in a task of its own.
+
+    The stdio and session contexts must be exited by the task that entered
+    them, so each server gets a dedicated task. That lets a server be started
+    on first use and shut down when idle without touching the others.
+    """
+
+    def __init__(self, name: str, config: Dict,
+                 discover: Callable[[ClientSession, str], Awaitable[Dict]],
+                 timeout: float, idle_timeout: Optional[float] = None,
+                 on_discovered: Optional[Callable[["ServerProcess", Dict], None]] = None) -> None:
+        """
+        Args:
+            name: Server name from server_config.json
+            config: The server's entry in server_config.json
+            discover: Initializes a session (given with the server name) and returns its capabilities
+            timeout: Seconds to wait for the handshake
+            idle_timeout: Seconds without use before the server is stopped (None keeps it running)
+            on_discovered: Called with the capabilities each time the server starts
+        """
+        self.name = name
+        self.config = config
+        self.discover = discover
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.on_discovered = on_discovered
+        self.session: Optional[ClientSession] = None
+        # Seconds from spawn to a finished handshake, for the latest start
+        self.startup_seconds = 0.0
+        self._ready: Optional[asyncio.Future] = None
+        self._task: Optional[asyncio.Task] = None
+        # Every run still alive, including ones shutting down after idling
+        self._tasks = set()
+        self._stop: Optional[asyncio.Event] = None
+        self._in_use = 0
+        self._last_used = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> Optional[Dict]:
+        """
+        Start the server if it isn't running and wait for its handshake.
+
+        Returns:
+            The server's capabilities, or None if it failed to start
+        """
+        if self._ready is None:
+            self._ready = asyncio.get_running_loop().create_future()
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self._run(self._ready, self._stop))
+            self._tasks.add(self._task)
+            self._task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(self._ready)
+
+    async def stop(self) -> None:
+        """Shut the server down and wait for its process to exit."""
+        if self._stop is not None:
+            self._stop.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    @asynccontextmanager
+    async def use(self) -> AsyncIterator[ClientSession]:
+        """Borrow the server's session, starting the server if needed; it won't idle out meanwhile."""
+        self._in_use += 1
+        try:
+            if await self.start() is None:
+                raise RuntimeError(f"server {self.name} failed to start")
+            yield self.session
+        finally:
+            self._in_use -= 1
+            self._last_used = time.monotonic()
+
+    def _idle_for(self) -> float:
+        return 0 if self._in_use else time.monotonic() - self._last_used
+
+    async def _run(self, ready: asyncio.Future, stop: asyncio.Event) -> None:
+        started = time.perf_counter()
+        span = tracer.start("connect", self.name)
+        try:
+            server_params = StdioServerParameters(**self.config)
+            async with stdio_client(server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    capabilities = await asyncio.wait_for(self.discover(session, self.name), self.timeout)
+                    tracer.finish(span)
+                    self.session = session
+                    self._last_used = time.monotonic()
+                    self.startup_seconds = time.perf_counter() - started
+                    if self.on_discovered is not None:
+                        self.on_discovered(self, capabilities)
+                    ready.set_result(capabilities)
+                    await self._wait_until_idle(stop)
+                    # New callers from here on get a fresh process
+                    self._forget(ready)
+                    if not stop.is_set():
+                        print(f"\nStopped {self.name} after {self.idle_timeout}s idle")
+        except asyncio.TimeoutError:
+            print(f"Failed to connect to {self.name}: timed out after {self.timeout}s")
+        except Exception as e:
+            if ready.done():
+                print(f"Error shutting down {self.name}: {e}")
+            else:
+                print(f"Failed to connect to {self.name}: {e}")
+            traceback.print_exc()
+        finally:
+            self._forget(ready)
+            if span.duration is None:
+                tracer.finish(span, RuntimeError("server failed to start"))
+            if not ready.done():
+                ready.set_result(None)
+
+    async def _wait_until_idle(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            if self.idle_timeout is None:
+                await stop.wait()
+                return
+            remaining = self.idle_timeout - self._idle_for()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(stop.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def _forget(self, ready: asyncio.Future) -> None:
+        # Only reset state that still belongs to this run
+        if self._ready is ready:
+            self._ready = None
+            self._task = None
+            self._stop = None
+            self.session = None
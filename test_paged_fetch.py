@@ -0,0 +1,162 @@
+# Checks that paged_fetch.fetch_all_pages reassembles a page exactly, using the
+# stand-in fetch tool from bench_stubs against a local HTTP page. Runs offline:
+#     python test_paged_fetch.py    (or: python -m pytest test_paged_fetch.py)
+import asyncio
+import os
+import random
+import sys
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from bench_stubs import VOCABULARY, StubPageServer, stub_fetch
+from paged_fetch import TRUNCATED_PATTERN, fetch_all_pages, split_page, truncated_note
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGE = 1000
+
+
+def page_text(length: int) -> str:
+    rng = random.Random(length)
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(VOCABULARY))
+    return " ".join(words)[:length]
+
+
+class CountingFetch:
+    """
+    stub_fetch with PAGE-sized pages, recording concurrency. Optionally fails
+    the page at fail_at, or marks every full page as truncated, the way a
+    server that can't tell where the content ends would.
+    """
+
+    def __init__(self, fail_at: int = None, mark_full_pages: bool = False) -> None:
+        self.fail_at = fail_at
+        self.mark_full_pages = mark_full_pages
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, arguments: dict) -> str:
+        arguments = {"max_length": PAGE, **arguments}
+        self.calls.append(arguments.get("start_index", 0))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Let the other pages of a window start before this one finishes
+            await asyncio.sleep(0.01)
+            if self.fail_at is not None and arguments.get("start_index", 0) == self.fail_at:
+                raise RuntimeError("connection reset")
+            page = await stub_fetch(**arguments)
+            _, body, next_start = split_page(page)
+            if self.mark_full_pages and next_start is None and len(body) == PAGE:
+                page += truncated_note(arguments.get("start_index", 0) + PAGE)
+            return page
+        finally:
+            self.in_flight -= 1
+
+
+def assemble(text: str, max_chars: int, concurrency: int = 4, fail_at: int = None, start_index: int = 0,
+             mark_full_pages: bool = False):
+    server = StubPageServer(text).start()
+    fetch = CountingFetch(fail_at, mark_full_pages)
+    try:
+        arguments = {"url": server.url}
+        if start_index:
+            arguments["start_index"] = start_index
+        result = asyncio.run(fetch_all_pages(fetch, arguments, max_chars, concurrency))
+    finally:
+        server.stop()
+    header, body, next_start = split_page(result)
+    assert header == f"Contents of {server.url}:\n"
+    return body, next_start, result, fetch
+
+
+def test_whole_page_in_concurrent_windows():
+    # The last page ends early (500 of 1000 characters)
+    text = page_text(9500)
+    body, next_start, result, fetch = assemble(text, max_chars=100000)
+    assert body == text
+    assert next_start is None and TRUNCATED_PATTERN.search(result) is None
+    assert fetch.max_in_flight == 4
+    # Every page is asked for once; the last window may also ask past the end
+    assert len(fetch.calls) == len(set(fetch.calls))
+    assert set(range(0, 9500, PAGE)) <= set(fetch.calls)
+
+
+def test_page_ending_on_a_page_boundary():
+    # The last full page claims there is more, so the next one comes back as
+    # "No more content", which must not end up in the text
+    text = page_text(3 * PAGE)
+    body, next_start, result, fetch = assemble(text, max_chars=100000, mark_full_pages=True)
+    assert body == text
+    assert next_start is None
+    assert "No more content" not in result
+    assert 3 * PAGE in fetch.calls
+
+
+def test_single_page_is_returned_as_is():
+    text = page_text(PAGE - 1)
+    body, next_start, _, fetch = assemble(text, max_chars=100000)
+    assert body == text and next_start is None
+    assert fetch.calls == [0]
+
+
+def test_failed_page_rewinds_to_it():
+    text = page_text(8 * PAGE)
+    body, next_start, result, _ = assemble(text, max_chars=100000, fail_at=3 * PAGE)
+    assert body == text[:3 * PAGE]
+    assert next_start == 3 * PAGE
+    assert result.endswith(truncated_note(3 * PAGE))
+
+
+def test_cap_cuts_off_with_marker():
+    text = page_text(8 * PAGE)
+    body, next_start, result, _ = assemble(text, max_chars=2500)
+    assert body == text[:2500]
+    assert next_start == 2500
+    assert result.endswith(truncated_note(2500))
+
+
+def test_starting_part_way_in():
+    text = page_text(5 * PAGE)
+    body, next_start, _, _ = assemble(text, max_chars=100000, start_index=1500)
+    assert body == text[1500:]
+    assert next_start is None
+
+
+def test_through_the_stdio_fetch_server():
+    """The stand-in as an MCP server, called the way the chatbots call fetch."""
+    text = page_text(6 * PAGE + 123)
+    server = StubPageServer(text).start()
+    params = StdioServerParameters(command=sys.executable, args=[os.path.join(REPO_DIR, "bench_stubs.py"), "fetch"])
+
+    async def run() -> str:
+        async with stdio_client(params) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+
+                async def fetch_page(arguments: dict) -> str:
+                    result = await session.call_tool("fetch", {"max_length": PAGE, **arguments})
+                    page = "\n".join(item.text for item in result.content if hasattr(item, "text"))
+                    if result.isError:
+                        raise RuntimeError(page)
+                    return page
+
+                return await fetch_all_pages(fetch_page, {"url": server.url}, 100000)
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        server.stop()
+    _, body, next_start = split_page(result)
+    assert body == text and next_start is None
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"ok  {name}")
+    print(f"{len(tests)} checks passed")
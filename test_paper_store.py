@@ -0,0 +1,130 @@
+# Checks the paper stores' guarantees under concurrent writers from several
+# processes, and recovery from a log record cut short by a crash. Runs offline:
+#     python test_paper_store.py    (or: python -m pytest test_paper_store.py)
+import multiprocessing
+import os
+import tempfile
+
+from paper_store import JsonPaperStore, SqlitePaperStore, topic_dir_name
+
+PROCESSES = 6
+PAPERS_PER_PROCESS = 150
+TOPICS = 3
+
+
+def paper(worker: int, i: int) -> dict:
+    return {
+        "title": f"Paper {i} from worker {worker}",
+        "authors": [f"Author {worker}"],
+        "summary": "x" * 200,
+        "pdf_url": f"http://arxiv.invalid/pdf/{worker}.{i}",
+        "published": f"2020-01-{1 + i % 28:02d}",
+    }
+
+
+def open_store(backend: str, paper_dir: str):
+    if backend == "sqlite":
+        return SqlitePaperStore(os.path.join(paper_dir, "papers.db"))
+    store = JsonPaperStore(paper_dir)
+    # Small logs, so topics and the index are compacted while others write
+    store.COMPACT_MIN_BYTES = 2000
+    return store
+
+
+def write_papers(backend: str, paper_dir: str, worker: int) -> None:
+    store = open_store(backend, paper_dir)
+    for i in range(PAPERS_PER_PROCESS):
+        store.add_papers(f"topic {i % TOPICS}", {f"p{worker}-{i}": paper(worker, i)})
+        # Read now and then, so readers race with compactions too
+        if i % 10 == 0:
+            store.get_topic_papers(f"topic {(i + 1) % TOPICS}")
+            store.list_topic_stats()
+
+
+def check_concurrent_writers(backend: str) -> None:
+    with tempfile.TemporaryDirectory(prefix="paper-store-") as paper_dir:
+        if backend == "sqlite":
+            # Create the schema once, before the writers race for it
+            open_store(backend, paper_dir)
+        processes = [
+            multiprocessing.Process(target=write_papers, args=(backend, paper_dir, worker))
+            for worker in range(PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        store = open_store(backend, paper_dir)
+        expected = {f"p{worker}-{i}" for worker in range(PROCESSES) for i in range(PAPERS_PER_PROCESS)}
+        stored = set()
+        for topic in range(TOPICS):
+            stored |= set(store.get_topic_papers(f"topic {topic}"))
+        assert stored == expected, f"{len(expected - stored)} papers lost"
+
+        # The index (or the SQLite tables) must know every paper and topic count
+        missing = [paper_id for paper_id in sorted(expected) if store.get_paper(paper_id) is None]
+        assert not missing, f"{len(missing)} papers missing from the index"
+        counts = {entry["topic"]: entry["paper_count"] for entry in store.list_topic_stats()}
+        per_topic = PROCESSES * PAPERS_PER_PROCESS // TOPICS
+        assert counts == {topic_dir_name(f"topic {t}"): per_topic for t in range(TOPICS)}, counts
+
+
+def test_json_store_with_concurrent_processes():
+    check_concurrent_writers("json")
+
+
+def test_sqlite_store_with_concurrent_processes():
+    check_concurrent_writers("sqlite")
+
+
+def test_json_store_recovers_from_a_torn_record():
+    with tempfile.TemporaryDirectory(prefix="paper-store-") as paper_dir:
+        store = JsonPaperStore(paper_dir)
+        store.add_papers("torn", {"a": paper(0, 1), "b": paper(0, 2)})
+
+        # A crash in the middle of the next append leaves half a record behind
+        topic_log = os.path.join(paper_dir, "torn", JsonPaperStore.LOG_FILE)
+        with open(topic_log, "ab") as log_file:
+            log_file.write(b'{"id": "c", "info": {"title": "cut sh')
+        with open(store.index_log, "ab") as log_file:
+            log_file.write(b'{"topic": "torn", "papers": ["c"')
+
+        # Readers, in this process or a new one, skip the partial record
+        for reader in (store, JsonPaperStore(paper_dir)):
+            assert set(reader.get_topic_papers("torn")) == {"a", "b"}
+            assert reader.get_paper("a") is not None
+            assert reader.get_paper("c") is None
+
+        # The next append terminates the torn line instead of merging into it
+        store = JsonPaperStore(paper_dir)
+        store.add_papers("torn", {"d": paper(0, 4)})
+        assert set(store.get_topic_papers("torn")) == {"a", "b", "d"}
+        fresh = JsonPaperStore(paper_dir)
+        assert set(fresh.get_topic_papers("torn")) == {"a", "b", "d"}
+        assert fresh.get_paper("d")["title"] == paper(0, 4)["title"]
+        assert [entry["paper_count"] for entry in fresh.list_topic_stats()] == [3]
+
+
+def test_search_without_results_adds_no_topic():
+    with tempfile.TemporaryDirectory(prefix="paper-store-") as paper_dir:
+        for backend in ("json", "sqlite"):
+            store = open_store(backend, paper_dir)
+            store.add_papers("nothing found", {})
+            assert not store.has_topic("nothing found"), backend
+            assert store.get_topic_page("nothing found", 0, 10) is None, backend
+            assert store.list_topic_stats() == [], backend
+
+            # A later search that finds papers creates the topic as usual
+            store.add_papers("nothing found", {"a": paper(0, 1)})
+            assert store.has_topic("nothing found"), backend
+            assert [entry["paper_count"] for entry in store.list_topic_stats()] == [1], backend
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"ok  {name}")
+    print(f"{len(tests)} checks passed")
@@ -0,0 +1,108 @@
+# Checks the full-text pipeline of paper_text.PaperTextCache against the
+# stand-in PDF server from bench_stubs: resumed downloads, a partial file the
+# server no longer matches, and recovery from responses that aren't a usable
+# PDF. Runs offline:
+#     python test_paper_text.py    (or: python -m pytest test_paper_text.py)
+import asyncio
+import os
+import tempfile
+
+from bench_stubs import SECTIONS, StubPDFServer, sample_pdf
+from paper_text import PaperTextCache
+
+PAPER_ID = "bench.1v1"
+
+
+def fetch_twice(server: StubPDFServer, text_dir: str):
+    """Ask for the paper, then ask again the way a retrying client would."""
+    cache = PaperTextCache(text_dir)
+    pdf_urls = {PAPER_ID: f"{server.base_url}/{PAPER_ID}"}
+
+    async def run():
+        first = await cache.fetch(pdf_urls, wait=30)
+        generation = cache.generation()
+        second = await cache.fetch(pdf_urls, wait=30)
+        return first[PAPER_ID], generation, second[PAPER_ID]
+
+    return cache, asyncio.run(run())
+
+
+def assert_ready(cache: PaperTextCache, status: dict) -> None:
+    assert status["status"] == "ready", status
+    with open(cache.pdf_path(PAPER_ID), "rb") as pdf_file:
+        assert pdf_file.read() == sample_pdf(1)
+    titles = [section["title"] for section in cache.section_index(PAPER_ID)["sections"]]
+    assert [title for title in titles if title in SECTIONS] == SECTIONS, titles
+    leftovers = [name for name in os.listdir(cache.text_dir) if name.endswith((".part", ".validator", ".tmp"))]
+    assert not leftovers, leftovers
+
+
+def test_dropped_download_resumes_with_a_range_request():
+    server = StubPDFServer(drop_after=3000).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="paper-text-") as text_dir:
+            cache, (status, generation, _) = fetch_twice(server, text_dir)
+            assert_ready(cache, status)
+            # One bump for the text, one for its section index
+            assert generation == 2
+            # The retry finds the text cached and downloads nothing
+            assert cache.generation() == 2
+    finally:
+        server.stop()
+    assert [request["start"] for request in server.requests] == [0, 3000]
+
+
+def test_changed_pdf_is_downloaded_from_the_start():
+    server = StubPDFServer().start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="paper-text-") as text_dir:
+            # Left behind by a download of an older version of the PDF
+            cache = PaperTextCache(text_dir)
+            part_path = cache.pdf_path(PAPER_ID) + ".part"
+            with open(part_path, "wb") as part_file:
+                part_file.write(b"%PDF-1.4\n" + b"old version " * 200)
+            with open(part_path + ".validator", "w") as validator_file:
+                validator_file.write('"old-etag"')
+
+            cache, (status, generation, _) = fetch_twice(server, text_dir)
+            assert_ready(cache, status)
+            assert generation == 2
+    finally:
+        server.stop()
+    # If-Range didn't match, so the server sent the whole file
+    assert [request["start"] for request in server.requests] == [0]
+
+
+def check_recovers_from(bad_response: str, error: str) -> None:
+    server = StubPDFServer(bad_response=bad_response).start()
+    try:
+        with tempfile.TemporaryDirectory(prefix="paper-text-") as text_dir:
+            cache, (first, generation, second) = fetch_twice(server, text_dir)
+            assert first["status"] == "failed" and error in first["error"], first
+            assert generation == 0
+            # The retry downloads again instead of failing on the bad file
+            assert_ready(cache, second)
+            assert cache.generation() == 2
+    finally:
+        server.stop()
+    assert len(server.requests) == 2
+
+
+def test_error_page_is_not_saved():
+    check_recovers_from("html", "text/html instead of a PDF")
+
+
+def test_error_page_sent_as_a_pdf_is_not_saved():
+    check_recovers_from("mislabelled", "not a PDF")
+
+
+def test_unreadable_pdf_is_downloaded_again():
+    check_recovers_from("corrupt", "Root object")
+
+
+if __name__ == "__main__":
+    tests = [(name, test) for name, test in sorted(globals().items()) if name.startswith("test_")]
+    for name, test in tests:
+        test()
+        print(f"ok  {name}")
+    print(f"{len(tests)} checks passed")
@@ -0,0 +1,136 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+# Tools whose results can be reused, with how long (seconds) they stay valid
+DEFAULT_TOOL_TTLS = {
+    "extract_info": 300,
+    "search_local": 60,
+    # Each page of a fetched URL is cached under its start_index
+    "fetch": 300,
+}
+# Resource URI prefixes whose contents can be reused, with their TTL
+DEFAULT_RESOURCE_TTLS = {
+    "papers://": 60,
+}
+# Tools that change server state; running one clears that server's cached results
+DEFAULT_MUTATING_TOOLS = ["search_papers", "search_papers_batch", "download_papers"]
+# Start of a tool's "not found" answer, which a later search or download can
+# change at any time, so it is never cached
+NEGATIVE_RESULTS = {
+    "extract_info": "There's no saved information",
+}
+
+
+class ToolResultCache:
+    """
+    Memoizes idempotent MCP tool calls and resource reads per server session.
+
+    Only tools and resource prefixes with a TTL are cached. Calling a
+    mutating tool drops every cached entry for the same session, since its
+    results may now be out of date. Each invalidation moves the session's
+    epoch on, so a call that was already running when it happened can tell
+    that its result may be stale and is not cached.
+    """
+
+    def __init__(self, tool_ttls: Optional[Dict[str, float]] = None,
+                 resource_ttls: Optional[Dict[str, float]] = None,
+                 mutating_tools: Optional[Iterable[str]] = None,
+                 max_entries: int = 256) -> None:
+        self.tool_ttls = DEFAULT_TOOL_TTLS if tool_ttls is None else tool_ttls
+        self.resource_ttls = DEFAULT_RESOURCE_TTLS if resource_ttls is None else resource_ttls
+        self.mutating_tools = set(DEFAULT_MUTATING_TOOLS if mutating_tools is None else mutating_tools)
+        self.max_entries = max_entries
+        # (session id, kind, name, arguments) -> (expires at, value), in LRU order
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # session id -> how many times its entries have been invalidated
+        self._epochs: Dict[int, int] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "ToolResultCache":
+        """
+        Build a cache from the "toolCache" section of server_config.json:
+        {"tools": {name: ttl}, "resources": {uri prefix: ttl},
+         "mutating": [names], "maxEntries": n}. Missing keys use the defaults.
+        """
+        return cls(
+            tool_ttls=config.get("tools"),
+            resource_ttls=config.get("resources"),
+            mutating_tools=config.get("mutating"),
+            max_entries=config.get("maxEntries", 256),
+        )
+
+    def _get(self, key: tuple) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key: tuple, ttl: float, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _resource_ttl(self, uri: str) -> Optional[float]:
+        for prefix, ttl in self.resource_ttls.items():
+            if uri.startswith(prefix):
+                return ttl
+        return None
+
+    @staticmethod
+    def _tool_key(session, tool_name: str, arguments: Dict) -> tuple:
+        return (id(session), "tool", tool_name, json.dumps(arguments, sort_keys=True, default=str))
+
+    def get_tool(self, session, tool_name: str, arguments: Dict) -> Optional[Any]:
+        if tool_name not in self.tool_ttls:
+            return None
+        return self._get(self._tool_key(session, tool_name, arguments))
+
+    def put_tool(self, session, tool_name: str, arguments: Dict, result: Any, epoch: Optional[int] = None) -> None:
+        """
+        Remember a tool result, or invalidate the session if the tool mutates state.
+
+        Args:
+            epoch: The session's epoch() from before the call; if the session
+                was invalidated since, the result is not cached
+        """
+        if tool_name in self.mutating_tools:
+            self.invalidate(session)
+        elif (tool_name in self.tool_ttls and not getattr(result, "isError", False)
+              and (epoch is None or epoch == self.epoch(session))
+              and not self._is_negative(tool_name, result)):
+            self._put(self._tool_key(session, tool_name, arguments), self.tool_ttls[tool_name], result)
+
+    @staticmethod
+    def _is_negative(tool_name: str, result: Any) -> bool:
+        prefix = NEGATIVE_RESULTS.get(tool_name)
+        if prefix is None:
+            return False
+        content = getattr(result, "content", None) or []
+        return any(getattr(item, "text", "").startswith(prefix) for item in content)
+
+    def get_resource(self, session, uri: str) -> Optional[Any]:
+        if self._resource_ttl(uri) is None:
+            return None
+        return self._get((id(session), "resource", uri, ""))
+
+    def put_resource(self, session, uri: str, result: Any) -> None:
+        ttl = self._resource_ttl(uri)
+        if ttl is not None:
+            self._put((id(session), "resource", uri, ""), ttl, result)
+
+    def epoch(self, session) -> int:
+        """How many times a session's entries have been invalidated."""
+        return self._epochs.get(id(session), 0)
+
+    def invalidate(self, session) -> None:
+        """Drop every cached entry for a session."""
+        self._epochs[id(session)] = self.epoch(session) + 1
+        for key in [key for key in self._entries if key[0] == id(session)]:
+            del self._entries[key]
@@ -0,0 +1,189 @@
+import json
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Iterator, List, Optional
+
+# Print full payloads (messages, responses, tool results) as well as timings
+VERBOSE = os.environ.get("MCP_VERBOSE", "").lower() in ("1", "true", "yes")
+# Quantiles reported in the Prometheus summary
+SUMMARY_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def debug(message: str) -> None:
+    """Print a payload dump, only when MCP_VERBOSE is set."""
+    if VERBOSE:
+        print(message)
+
+
+def payload_bytes(payload: Any) -> int:
+    """Size of a payload as it would go over the wire, roughly."""
+    if payload is None:
+        return 0
+    if isinstance(payload, str):
+        return len(payload.encode())
+    if hasattr(payload, "model_dump_json"):
+        return len(payload.model_dump_json())
+    return len(json.dumps(payload, default=str))
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Span:
+    """One timed phase: a name, a target (server, tool, model or URI) and free-form attributes."""
+
+    def __init__(self, name: str, target: str = "", **attrs: Any) -> None:
+        self.name = name
+        self.target = target
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._started = time.perf_counter()
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def first_token(self) -> None:
+        """Mark the first streamed token; only the first call counts."""
+        if "time_to_first_token" not in self.attrs:
+            self.attrs["time_to_first_token"] = round(time.perf_counter() - self._started, 6)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = type(error).__name__
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span": self.name,
+            "target": self.target,
+            "started_at": round(self.started_at, 6),
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+            "error": self.error,
+            **self.attrs,
+        }
+
+
+class Tracer:
+    """
+    Records spans for the chatbot's phases and exports them.
+
+    Finished spans are kept in memory (the most recent max_spans) and, if
+    jsonl_path is set, appended to it as JSON lines. prometheus() summarizes
+    them as Prometheus text: latency quantiles, time to first token and
+    payload bytes per span name and target.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None, metrics_path: Optional[str] = None,
+                 max_spans: int = 10000) -> None:
+        self.jsonl_path = jsonl_path
+        self.metrics_path = metrics_path
+        self.spans: "deque[Span]" = deque(maxlen=max_spans)
+
+    def start(self, name: str, target: str = "", **attrs: Any) -> Span:
+        return Span(name, target, **attrs)
+
+    def finish(self, span: Span, error: Optional[BaseException] = None) -> None:
+        span.finish(error)
+        self.spans.append(span)
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a") as file:
+                file.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    @contextmanager
+    def span(self, name: str, target: str = "", **attrs: Any) -> Iterator[Span]:
+        """Time the enclosed block as a span; an exception is recorded on it and re-raised."""
+        span = self.start(name, target, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, e)
+            raise
+        self.finish(span)
+
+    def write_jsonl(self, path: str) -> None:
+        """Write every span still in memory to path as JSON lines."""
+        with open(path, "w") as file:
+            for span in self.spans:
+                file.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    @staticmethod
+    def _quantile(values: List[float], q: float) -> float:
+        # Nearest rank on sorted values
+        return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+    def prometheus(self) -> str:
+        """Summarize the recorded spans in the Prometheus text exposition format."""
+        groups: Dict[tuple, List[Span]] = defaultdict(list)
+        for span in self.spans:
+            groups[(span.name, span.target)].append(span)
+
+        def labels(name: str, target: str, **extra: str) -> str:
+            pairs = {"span": name, "target": target, **extra}
+            return ",".join(f'{key}="{_escape_label(value)}"' for key, value in pairs.items())
+
+        lines = [
+            "# HELP mcp_span_seconds Time spent in each chatbot phase.",
+            "# TYPE mcp_span_seconds summary",
+        ]
+        for (name, target), spans in sorted(groups.items()):
+            durations = sorted(span.duration for span in spans)
+            for q in SUMMARY_QUANTILES:
+                lines.append(f"mcp_span_seconds{{{labels(name, target, quantile=str(q))}}} {self._quantile(durations, q):.6f}")
+            lines.append(f"mcp_span_seconds_sum{{{labels(name, target)}}} {sum(durations):.6f}")
+            lines.append(f"mcp_span_seconds_count{{{labels(name, target)}}} {len(durations)}")
+
+        lines += [
+            "# HELP mcp_time_to_first_token_seconds Time until a streamed model response produced output.",
+            "# TYPE mcp_time_to_first_token_seconds summary",
+        ]
+        for (name, target), spans in sorted(groups.items()):
+            ttfts = sorted(span.attrs["time_to_first_token"] for span in spans if "time_to_first_token" in span.attrs)
+            if not ttfts:
+                continue
+            for q in SUMMARY_QUANTILES:
+                lines.append(f"mcp_time_to_first_token_seconds{{{labels(name, target, quantile=str(q))}}} {self._quantile(ttfts, q):.6f}")
+            lines.append(f"mcp_time_to_first_token_seconds_sum{{{labels(name, target)}}} {sum(ttfts):.6f}")
+            lines.append(f"mcp_time_to_first_token_seconds_count{{{labels(name, target)}}} {len(ttfts)}")
+
+        for metric, key, help_text in (
+            ("mcp_request_bytes_total", "request_bytes", "Bytes sent in each chatbot phase."),
+            ("mcp_response_bytes_total", "response_bytes", "Bytes received in each chatbot phase."),
+            ("mcp_span_errors_total", None, "Spans that ended with an exception."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (name, target), spans in sorted(groups.items()):
+                if key is None:
+                    value = sum(1 for span in spans if span.error)
+                else:
+                    value = sum(span.attrs.get(key, 0) for span in spans)
+                lines.append(f"{metric}{{{labels(name, target)}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, path: Optional[str] = None) -> None:
+        """Write the Prometheus summary to path (default metrics_path), if one is set."""
+        path = path or self.metrics_path
+        if path:
+            with open(path, "w") as file:
+                file.write(self.prometheus())
+
+
+# Shared by everything in the chatbot process. MCP_TRACE_FILE receives spans
+# as JSON lines as they finish; MCP_METRICS_FILE the summary at exit.
+tracer = Tracer(
+    jsonl_path=os.environ.get("MCP_TRACE_FILE"),
+    metrics_path=os.environ.get("MCP_METRICS_FILE"),
+)
+
+
+async def traced(name: str, target: str, awaitable: Awaitable[Any], **attrs: Any) -> Any:
+    """Await something inside a span, recording the size of its result."""
+    with tracer.span(name, target, **attrs) as span:
+        result = await awaitable
+        span.set(response_bytes=payload_bytes(result))
+        return result